@@ -0,0 +1,196 @@
+"""
+Rolling archive of the finished days of the actuals and forecasts, one fixed-layout memory-mapped array per
+source shaped (site, day, 96 slots) with a json index of the sites and days on the side. A day goes to the
+slot date.toordinal() % config.ARCHIVE_DAYS, the oldest day is overwritten once the archive is full, so the
+history of a site is a slice of the array instead of one file open per day and source.
+
+The days are appended by funcs.compact_archive, run it as a script (e.g. nightly from cron):
+    python archive.py [--days N]
+"""
+import os
+import json
+import logging
+import argparse
+import datetime
+import threading
+import numpy as np
+import config
+
+logger = logging.getLogger(__name__)
+
+N_SLOTS = 96
+SOURCES = ['Actual', 'IntraDay', 'Day Ahead Ensemble', 'Satellite']
+
+# Read-only maps and the last loaded index of this process
+_arrays = {}
+_index = None
+_lock = threading.Lock()
+
+
+def is_enabled():
+    return config.archive_path is not None
+
+
+def get_shape():
+    return config.ARCHIVE_MAX_SITES, config.ARCHIVE_DAYS, N_SLOTS
+
+
+def get_array_file(source):
+    return os.path.join(config.archive_path, source.replace(' ', '_') + '.f64')
+
+
+def get_index_file():
+    return os.path.join(config.archive_path, 'index.json')
+
+
+def get_slot(date):
+    """
+    :param date: datetime.date
+    :return: int, day position of the date in the arrays
+    """
+    return date.toordinal() % config.ARCHIVE_DAYS
+
+
+def open_array(source, mode='r'):
+    """
+    Memory map of a source, created filled with NaN the first time it is opened for writing
+    :param mode: 'r' for the readers, 'r+' for the compaction
+    :return: np.memmap of shape get_shape()
+    """
+    array_file = get_array_file(source)
+    if mode == 'r+' and not os.path.exists(array_file):
+        array = np.memmap(array_file, dtype=np.float64, mode='w+', shape=get_shape())
+        array[:] = np.nan
+        array.flush()
+        return array
+    return np.memmap(array_file, dtype=np.float64, mode=mode, shape=get_shape())
+
+
+def load_index():
+    """
+    :return: dict(sites=list, days={slot as str: [iso date, source versions]}), empty when not compacted yet
+    """
+    try:
+        with open(get_index_file()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict(sites=[], days={})
+
+
+def save_index(index):
+    os.makedirs(config.archive_path, exist_ok=True)
+    tmp_file = f"{get_index_file()}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_file, get_index_file())
+
+
+def get_index():
+    """
+    Index of the readers, reloaded only when the compaction wrote a new one
+    :return: tuple(dict of site: row, dict of slot: (datetime.date, version tuple))
+    """
+    global _index
+    try:
+        mtime = os.stat(get_index_file()).st_mtime_ns
+    except OSError:
+        return {}, {}
+    with _lock:
+        if _index is None or _index[0] != mtime:
+            index = load_index()
+            sites = {site: row for row, site in enumerate(index['sites'])}
+            days = {int(slot): (datetime.date.fromisoformat(date), tuple(version))
+                    for slot, (date, version) in index['days'].items()}
+            _index = (mtime, sites, days)
+        return _index[1], _index[2]
+
+
+def get_array(source):
+    with _lock:
+        if source not in _arrays:
+            _arrays[source] = open_array(source)
+        return _arrays[source]
+
+
+def write_days(days):
+    """
+    Appends finished days, the slots are first dropped from the index so a reader never takes a slot being
+    rewritten for the day it held before
+    :param days: list of (datetime.date, version tuple, sites, dict of source: np.ndarray (96, len(sites)))
+    :return: int, number of days written
+    """
+    if not days:
+        return 0
+    index = load_index()
+    for date, _, _, _ in days:
+        index['days'].pop(str(get_slot(date)), None)
+    save_index(index)
+
+    rows = {site: row for row, site in enumerate(index['sites'])}
+    arrays = {source: open_array(source, mode='r+') for source in SOURCES}
+    for date, version, sites, blocks in days:
+        slot = get_slot(date)
+        for source in SOURCES:
+            arrays[source][:, slot] = np.nan
+        for i, site in enumerate(sites):
+            if site not in rows:
+                if len(rows) == config.ARCHIVE_MAX_SITES:
+                    logger.warning(f"Archive full, {site} is not archived (config.ARCHIVE_MAX_SITES)")
+                    continue
+                rows[site] = len(rows)
+                index['sites'].append(site)
+            for source in SOURCES:
+                arrays[source][rows[site], slot] = blocks[source][:, i]
+        index['days'][str(slot)] = [date.isoformat(), list(version)]
+
+    for array in arrays.values():
+        array.flush()
+    save_index(index)
+    return len(days)
+
+
+def read_site_history(site, start_date, end_date):
+    """
+    Archived values of a site over a date range, a view of the maps unless the range wraps around the end
+    of the arrays
+    :param start_date: datetime.date
+    :param end_date: datetime.date
+    :return: tuple(list of the version of every date or None when it is not archived,
+                   dict of source: np.ndarray (n_days, 96)) or None when the site has no history
+    """
+    if not is_enabled():
+        return None
+    sites, days = get_index()
+    if site not in sites:
+        return None
+
+    n_days = (end_date - start_date).days + 1
+    if n_days > config.ARCHIVE_DAYS:
+        return None
+    versions = []
+    for day in range(n_days):
+        date = start_date + datetime.timedelta(days=day)
+        entry = days.get(get_slot(date))
+        versions.append(entry[1] if entry is not None and entry[0] == date else None)
+    if not any(versions):
+        return None
+
+    first, last = get_slot(start_date), get_slot(end_date)
+    history = {}
+    for source in SOURCES:
+        rows = get_array(source)[sites[site]]
+        history[source] = rows[first:last + 1] if first <= last else np.concatenate([rows[first:], rows[:last + 1]])
+    return versions, history
+
+
+if __name__ == '__main__':
+    import funcs
+
+    parser = argparse.ArgumentParser(description="Append the finished days to the rolling archive")
+    parser.add_argument('--days', type=int, default=None, help="Only the last N days, all the archive by default")
+    args = parser.parse_args()
+
+    n_days = min(args.days or config.ARCHIVE_DAYS, config.ARCHIVE_DAYS)
+    end = datetime.date.today() - datetime.timedelta(days=1)
+    n_written = funcs.compact_archive(start_date=end - datetime.timedelta(days=n_days - 1), end_date=end)
+    print(f"{n_written} days archived in {config.archive_path}")
@@ -0,0 +1,13 @@
+/* Refreshes the graphs when the server reports a data change, see watcher.py and the /events route */
+(function () {
+    if (!window.EventSource) {
+        return;
+    }
+    var source = new EventSource('/events');
+    source.onmessage = function () {
+        var trigger = document.getElementById('data-changed-trigger');
+        if (trigger) {
+            trigger.click();
+        }
+    };
+})();
@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of the frame assembly in read_all_data_for_date_site: the former chained pd.merge build
+against funcs.assemble_frame. Checks both give the same frame before timing them.
+
+Run from src_dash:
+    python benchmarks/bench_assembly.py [--repeat N]
+"""
+import os
+import sys
+import timeit
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import funcs  # noqa: E402
+
+
+def merge_assembly(real, intraday, da_ensemble, satellite, log_data):
+    """
+    The chained merge build read_all_data_for_date_site used before assemble_frame
+    """
+    time_axis = pd.date_range(start='1/1/2018', periods=96, freq='15T').time
+    intraday.name = 'IntraDay'
+    real.name = 'Actual'
+    da_ensemble.name = 'Day Ahead Ensemble'
+    satellite.name = 'Satellite'
+    log_data.name = 'Logs'
+
+    temp_1 = pd.merge(left=intraday, right=da_ensemble, left_index=True, right_index=True, how='outer')
+    temp_2 = pd.merge(left=temp_1, right=satellite, left_index=True, right_index=True, how='outer')
+    temp_3 = pd.merge(left=temp_2, right=log_data, left_index=True, right_index=True, how='outer')
+    temp_4 = pd.merge(left=temp_3, right=real, left_index=True, right_index=True, how='outer')
+    temp_4 = temp_4.fillna(np.nan)
+
+    def map_index_fun(x): return x.strftime('%H:%M')
+    time_axis = [map_index_fun(x) for x in time_axis]
+    temp_4.index = time_axis
+    temp_4 = temp_4.round(2)
+    return temp_4
+
+
+def make_sources(seed=0):
+    rng = np.random.default_rng(seed)
+    real = pd.Series(rng.random(95) * 1000)
+    intraday = pd.Series(rng.random(95) * 1000)
+    da_ensemble = pd.Series(rng.random(95) * 1000)
+    satellite = pd.Series(np.repeat(np.nan, 96))
+    log_data = pd.DataFrame(rng.random((96, 2)) * 1000, columns=['10:30:00', '13:30:00'])
+    return real, intraday, da_ensemble, satellite, log_data
+
+
+def assemble(real, intraday, da_ensemble, satellite, log_data):
+    return funcs.assemble_frame([('IntraDay', intraday),
+                                 ('Day Ahead Ensemble', da_ensemble),
+                                 ('Satellite', satellite),
+                                 ('Logs', log_data),
+                                 ('Actual', real)])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the frame assembly of read_all_data_for_date_site")
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    sources = make_sources()
+    pd.testing.assert_frame_equal(merge_assembly(*sources), assemble(*sources))
+
+    for label, builder in [('chained pd.merge', merge_assembly), ('assemble_frame', assemble)]:
+        best = min(timeit.repeat(lambda: builder(*sources), number=args.repeat, repeat=5)) / args.repeat
+        print(f"{label:>18}: {best * 1e6:8.1f} us per frame")
@@ -0,0 +1,150 @@
+"""
+Benchmark of the dashboard i/o layer against the size of the archive: folder scans, site discovery, cold and
+warm reads of a (date, site), figure construction and the full callback path through the Flask server.
+Archives are generated with make_archive.py in a temp folder unless --root points to existing ones.
+"Cold" means the caches of the process are empty, the OS page cache is not dropped.
+
+Run from src_dash:
+    python benchmarks/bench_io.py [--days 30 365 1095] [--sites 30] [--repeat 5] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config  # noqa: E402
+import funcs  # noqa: E402
+import store  # noqa: E402
+from make_archive import SOURCES, make_archive  # noqa: E402
+
+
+def time_call(fn, repeat, setup=None):
+    """
+    :return: tuple(best, median) in ms
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times), statistics.median(times)
+
+
+def clear_process_caches():
+    funcs.clear_data_cache()
+    funcs._dir_index.clear()
+
+
+def use_archive(paths, store_path):
+    for name, path in paths.items():
+        setattr(config, name, path)
+    config.columnar_store_path = store_path
+    config.shared_cache_path = None
+
+
+def fire_callback(client, app, output, inputs, state):
+    callback = app.callback_map[output]
+    outputs = [dict(id=item.split('.')[0], property=item.split('.')[1])
+               for item in output.strip('.').split('...')]
+    body = dict(output=output, outputs=outputs, changedPropIds=[],
+                inputs=[dict(id=i['id'], property=i['property'], value=v) for i, v in zip(callback['inputs'], inputs)],
+                state=[dict(id=i['id'], property=i['property'], value=v) for i, v in zip(callback['state'], state)])
+    response = client.post('/_dash-update-component', json=body)
+    assert response.status_code in (200, 204), response.get_data(as_text=True)[:500]
+    return response.get_json() if response.status_code == 200 else None
+
+
+def run(paths, n_days, repeat):
+    results = []
+
+    def record(case, timing):
+        results.append(dict(days=n_days, case=case, best_ms=round(timing[0], 2), median_ms=round(timing[1], 2)))
+        print(f"{n_days:>6} days  {case:<42} best {timing[0]:9.2f} ms   median {timing[1]:9.2f} ms")
+
+    date = datetime.date.today().strftime('%d-%m-%Y')
+    site = 'NR_Solar'
+    read_kwargs = dict(real_path=paths['real_path'],
+                       intra_day_path=paths['intra_day_path'],
+                       day_ahead_ensemble_path=paths['day_ahead_ensemble_path'],
+                       satellite_forecast_path=paths['satellite_forecast_path'],
+                       log_path=paths['logs_path'],
+                       date=date,
+                       site=site)
+    date_dirs = [paths['real_path'], paths['day_ahead_ensemble_path'], paths['satellite_forecast_path']]
+
+    record('get_min_max_dates', time_call(lambda: funcs.get_min_max_dates(False, *date_dirs,
+                                                                          log_path=paths['logs_path']), repeat))
+    record('get_site_options (cold)', time_call(lambda: funcs.get_site_options(paths['real_path']), repeat,
+                                                setup=clear_process_caches))
+
+    store_path = config.columnar_store_path
+    config.columnar_store_path = None
+    record('read_all_data_for_date_site (cold, csv)',
+           time_call(lambda: funcs.read_all_data_for_date_site(**read_kwargs), repeat, setup=clear_process_caches))
+    config.columnar_store_path = store_path
+    for name, path in paths.items():
+        store.ingest_folder(path, source_type='log' if name == 'logs_path' else 'csv',
+                            since=datetime.date.today() - datetime.timedelta(days=2))
+    record('read_all_data_for_date_site (cold, store)',
+           time_call(lambda: funcs.read_all_data_for_date_site(**read_kwargs), repeat, setup=clear_process_caches))
+    funcs.get_data_for_date_site(**read_kwargs)
+    record('get_data_for_date_site (warm)', time_call(lambda: funcs.get_data_for_date_site(**read_kwargs), repeat))
+
+    import main
+    data, color_codes = main.select_outputs(funcs.get_data_for_date_site(**read_kwargs),
+                                            ['Actual', 'Day Ahead Ensemble', 'IntraDay', 'Logs'])
+    iso_date = datetime.date.today().isoformat()
+    record('solar_figure', time_call(lambda: main.solar_figure(data, color_codes, True), repeat))
+    record('error_figure', time_call(lambda: main.error_figure(site, iso_date, None, None, True), repeat))
+
+    client = main.server.test_client()
+    solar_output = '..solar-graph.figure...solar-graph.extendData...solar-graph-state.data..'
+    solar_inputs = [site, iso_date, 0, 0, ['Actual', 'Day Ahead Ensemble', 'IntraDay'], 'day', None, None, None]
+
+    def clear_all_caches():
+        clear_process_caches()
+        main._figure_cache.clear()
+
+    record('solar callback (cold)', time_call(lambda: fire_callback(client, main.app, solar_output, solar_inputs,
+                                                                    [None]), repeat, setup=clear_all_caches))
+    state = fire_callback(client, main.app, solar_output, solar_inputs, [None])['response']['solar-graph-state']
+    record('solar callback (unchanged refresh)',
+           time_call(lambda: fire_callback(client, main.app, solar_output, solar_inputs, [state['data']]), repeat))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard i/o layer")
+    parser.add_argument('--days', type=int, nargs='+', default=[30, 365])
+    parser.add_argument('--sites', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--root', default=None, help="Folder of the archives, generated when missing")
+    parser.add_argument('--json', default=None, help="Write the results to this file")
+    args = parser.parse_args()
+
+    config.BACKGROUND_TASKS = False
+    root = args.root or tempfile.mkdtemp(prefix='solar_dash_bench_')
+    all_results = []
+    try:
+        for days in args.days:
+            archive = os.path.join(root, f"{args.sites}_sites_{days}_days")
+            if not os.path.isdir(archive):
+                make_archive(archive, n_sites=args.sites, n_days=days, n_log_days=2)
+            archive_paths = {name: os.path.join(archive, folder) for name, folder in SOURCES.items()}
+            use_archive(archive_paths, store_path=os.path.join(archive, 'store'))
+            all_results.extend(run(archive_paths, days, args.repeat))
+    finally:
+        if args.root is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(all_results, f, indent=2)
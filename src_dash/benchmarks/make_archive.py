@@ -0,0 +1,85 @@
+"""
+Writes a synthetic archive in the layout of the forecast folders, for benchmarks and sizing:
+    real/, IntraDay/, Predicted/, Satellite/  one '%d-%m-%Y.csv' per day, a 'Time' column and one column per site
+    log/                                      one '%d-%m-%Y_log.xlsx' per day, one sheet per site
+
+Run from src_dash:
+    python benchmarks/make_archive.py ROOT [--sites N] [--days N] [--log-days N]
+"""
+import os
+import argparse
+import datetime
+import numpy as np
+import pandas as pd
+
+SOURCES = {'real_path': 'real',
+           'intra_day_path': 'IntraDay',
+           'day_ahead_ensemble_path': 'Predicted',
+           'satellite_forecast_path': 'Satellite',
+           'logs_path': 'log'}
+
+TIMES = pd.date_range(start='1/1/2018', periods=96, freq='15T').strftime('%H:%M')
+
+
+def get_site_names(n_sites):
+    return ['NR_Solar'] + [f"Site_{i:02d}" for i in range(1, n_sites)]
+
+
+def solar_profile(rng, capacity):
+    """
+    Bell shaped generation between 06:00 and 18:00 with some noise, 96 slots
+    """
+    hours = np.arange(96) / 4
+    shape = np.clip(np.sin((hours - 6) / 12 * np.pi), 0, None)
+    return np.round(capacity * shape * rng.uniform(0.8, 1.0, 96), 2)
+
+
+def write_day(root, date, sites, rng, with_log=True):
+    date_str = date.strftime('%d-%m-%Y')
+    capacities = np.linspace(50, 2000, len(sites))
+    actual = {site: solar_profile(rng, capacity) for site, capacity in zip(sites, capacities)}
+
+    for folder in ['real', 'IntraDay', 'Predicted', 'Satellite']:
+        noise = 0 if folder == 'real' else 0.1
+        data = {site: np.round(values * rng.normal(1, noise, 96), 2) for site, values in actual.items()}
+        frame = pd.DataFrame(dict(Time=TIMES, **data))
+        frame.to_csv(os.path.join(root, folder, f"{date_str}.csv"), index=False)
+
+    if with_log:
+        with pd.ExcelWriter(os.path.join(root, 'log', f"{date_str}_log.xlsx"), engine='openpyxl') as writer:
+            for site, values in actual.items():
+                frame = pd.DataFrame({'Time': TIMES,
+                                      'Forecast 10:30:00': np.round(values * rng.normal(1, 0.1, 96), 2),
+                                      'Forecast 13:30:00': np.round(values * rng.normal(1, 0.1, 96), 2)})
+                frame.to_excel(writer, sheet_name=site, index=False)
+
+
+def make_archive(root, n_sites=30, n_days=365, n_log_days=30, end_date=None, seed=0):
+    """
+    Writes n_days of files ending on end_date (today by default), the log workbooks only for the last
+    n_log_days as they are slow to write
+    :return: dict of the config path names (real_path, ...) to the folders of the archive
+    """
+    rng = np.random.default_rng(seed)
+    end_date = end_date or datetime.date.today()
+    sites = get_site_names(n_sites)
+    paths = {name: os.path.join(root, folder) for name, folder in SOURCES.items()}
+    for path in paths.values():
+        os.makedirs(path, exist_ok=True)
+
+    for day in range(n_days):
+        date = end_date - datetime.timedelta(days=day)
+        write_day(root, date, sites, rng, with_log=day < n_log_days)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic forecast archive")
+    parser.add_argument('root')
+    parser.add_argument('--sites', type=int, default=30)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--log-days', type=int, default=30)
+    args = parser.parse_args()
+
+    for name, path in make_archive(args.root, args.sites, args.days, args.log_days).items():
+        print(f"{name} = '{path}'")
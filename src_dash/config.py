@@ -6,6 +6,9 @@ import os
 # DASH OPTIONS
 error_bars_for = ['IntraDay']
 # Add or remove from  Options:  ['Day Ahead Ensemble', 'Satellite', 'IntraDay', 'Logs']
+METRICS_DAYS = 7  # days (from today backwards) the metrics engine keeps up to date for every site
+METRICS_REFRESH_SECS = 60
+OPTIONS_REFRESH_SECS = 10 * 60  # rescan of the sites and date bounds
 
 
 # HOST
@@ -13,6 +16,10 @@ HOST = '127.0.0.1'
 # HOST = '10.10.2.34'
 PORT = '7500'
 
+# PRODUCTION SERVING (gunicorn -c gunicorn.conf.py wsgi:server)
+WORKERS = 4
+WORKER_THREADS = 32  # every open dashboard holds a thread for its /events stream
+
 # PATH CONFIG
 # real_path = '/home/nrldc/Solar_Forecast/real'
 # intra_day_path = '/home/nrldc/Solar_Forecast/IntraDay'
@@ -27,8 +34,23 @@ day_ahead_ensemble_path = '/Users/vasu/TensorDynamics/SolarDash/da_ensemble'
 satellite_forecast_path = '/Users/vasu/TensorDynamics/SolarDash/satellite_pred'
 logs_path = '/Users/vasu/TensorDynamics/SolarDash/log'
 
+# COLUMNAR STORE (filled by `python store.py`), set to None to always read the raw files
+# columnar_store_path = '/home/nrldc/Solar_Forecast/dash_store'
+columnar_store_path = '/Users/vasu/TensorDynamics/SolarDash/dash_store'
+
+# ROLLING ARCHIVE of the finished days (filled by `python archive.py`), set to None to always read the daily files
+# archive_path = '/home/nrldc/Solar_Forecast/dash_archive'
+archive_path = '/Users/vasu/TensorDynamics/SolarDash/dash_archive'
+
 src_path = os.path.join(os.getcwd())
 
+# Sites and date bounds found by the last discovery, loaded at startup so it does not scan the folders
+options_snapshot_path = os.path.join(src_path, 'dash_options.json')
+
+# Cache shared by the workers on the local disk, set to None for a single process
+# shared_cache_path = '/home/nrldc/Solar_Forecast/dash_cache'
+shared_cache_path = '/Users/vasu/TensorDynamics/SolarDash/dash_cache'
+
 # DASH UI SETTINGS
 G1_HEIGHT = 600
 G2_HEIGHT = 150
@@ -37,4 +59,39 @@ GEN_FONT_GRAPHS = 12
 HOVER_SIZE = 16
 GRAPH_BG = '#242526'  # '#242526' DEV RENDER -> Prod - '#28231D'
 GRID_COL = '#404040'  # '#404040' DEV RENDER -> Prod - '#212121'
-REFRESH_RATE = 2  # MINS
+REFRESH_RATE = 15  # MINS, fallback only: the graphs refresh on the data change events of watcher.py
+MAX_RANGE_DAYS = 92  # longest span allowed in the date range view
+PLOT_WIDTH_PX = 1200  # long series are downsampled to min/max buckets of about one pixel
+WEBGL_THRESHOLD = 5000  # points above which the range view draws with WebGL (Scattergl)
+EXPORT_MAX_DAYS = 366  # longest span of a /export request
+
+# PROFILING (cProfile of single requests, see instrumentation.py)
+PROFILING_ENABLED = False
+profile_path = os.path.join(src_path, 'profiles')
+
+# DAILY FILE NAMES
+# Patterns of the daily files of a source type in order of precedence, {date} stands for the dd-mm-yyyy date.
+# Other files (e.g. scaled exports) are ignored and a copy is only read when the original is missing.
+FILE_PATTERNS = {'csv': [r'{date}\.csv', r'{date}[ _-]?(copy|\(\d+\))\.csv'],
+                 'log': [r'{date}_log\.xlsx', r'{date}_log[ _-]?(copy|\(\d+\))\.xlsx']}
+DUPLICATE_FILES = 'newest'  # several files of the same pattern for a date: 'newest' mtime wins, or 'error'
+
+# DATA I/O SETTINGS
+BACKGROUND_TASKS = True  # options discovery, metrics engine, file watcher and pre-warming threads
+DATA_CACHE_SIZE = 128  # (date, site) frames kept in memory
+DATA_CACHE_TTL = 10 * 60  # SECS, entries are also dropped as soon as a source file changes
+FIGURE_CACHE_SIZE = 256  # rendered figures kept per (view, data version), room for the pre-warmed ones
+READ_WORKERS = 5  # threads reading the sources of a (date, site) concurrently
+SLOW_READ_SECS = 2  # a source read slower than this is logged as a warning
+SHARED_CACHE_TTL = 60 * 60  # SECS
+SHARED_CACHE_MAX_ENTRIES = 5000  # per namespace
+SHARED_CACHE_PRUNE_SECS = 10 * 60
+WATCH_INTERVAL_SECS = 10  # stat poll of the watched source files
+WATCH_DAYS = (-1, 0, 1)  # watched dates relative to today
+PREWARM_DAYS = (0, 1)  # dates relative to today whose views are computed as soon as their files change
+PREWARM_INTERVAL_SECS = 60  # longest wait between two checks when no data change event comes
+SSE_KEEPALIVE_SECS = 25
+SSE_RETRY_MS = 5000  # browser reconnect delay
+DIR_INDEX_MAX_AGE = 5 * 60  # SECS, forced rescan of a source folder even if its mtime did not change
+ARCHIVE_DAYS = 400  # days kept in the rolling archive, changing it needs a new archive
+ARCHIVE_MAX_SITES = 64  # site rows of the archive arrays, changing it needs a new archive
@@ -0,0 +1,208 @@
+"""
+Bulk export of the merged Actual / forecasts / Logs data of a list of sites over a date range.
+The rows are read and written one day (all the requested sites) at a time and streamed to the client, so the
+full result is never held in memory and a year of the whole fleet can be downloaded by any worker.
+
+csv has no extra dependency, parquet and arrow (IPC stream) need pyarrow.
+"""
+import io
+import datetime
+import numpy as np
+import pandas as pd
+import config
+import funcs
+import instrumentation
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+MIMETYPES = {'csv': 'text/csv',
+             'parquet': 'application/vnd.apache.parquet',
+             'arrow': 'application/vnd.apache.arrow.stream'}
+
+# The log columns are named after the time of the run, they are exported as Log 1 / Log 2 with their run time
+VALUE_COLUMNS = funcs.RANGE_COLUMNS + ['Log 1', 'Log 2']
+COLUMNS = ['Date', 'Time', 'Site'] + VALUE_COLUMNS + ['Log 1 Run', 'Log 2 Run']
+
+
+def get_formats():
+    return [fmt for fmt in MIMETYPES if fmt == 'csv' or pa is not None]
+
+
+def parse_args(args, all_sites):
+    """
+    Checks the query of an export request
+    :param args: mapping with 'start' and 'end' ('%Y-%m-%d'), optional 'sites' (comma separated, all by default)
+                 and 'format' (csv by default)
+    :param all_sites: list of the known sites
+    :return: tuple(list of sites, start datetime.date, end datetime.date, format)
+    :raise ValueError: with the message for the client
+    """
+    fmt = args.get('format', 'csv')
+    if fmt not in get_formats():
+        raise ValueError(f"format must be one of {', '.join(get_formats())}")
+
+    try:
+        start_date = datetime.date.fromisoformat(args['start'])
+        end_date = datetime.date.fromisoformat(args.get('end', args['start']))
+    except (KeyError, ValueError):
+        raise ValueError("start and end must be dates formatted as YYYY-MM-DD")
+    if end_date < start_date:
+        raise ValueError("end is before start")
+    if (end_date - start_date).days >= config.EXPORT_MAX_DAYS:
+        raise ValueError(f"at most {config.EXPORT_MAX_DAYS} days can be exported at once")
+
+    sites = [site for site in args.get('sites', '').split(',') if site] or list(all_sites)
+    unknown = [site for site in sites if site not in all_sites]
+    if unknown:
+        raise ValueError(f"unknown sites: {', '.join(unknown)}")
+    return sites, start_date, end_date, fmt
+
+
+def read_logs(log_path, date, site):
+    """
+    Log runs of a site-day
+    :param date: str '%d-%m-%Y'
+    :return: tuple(np.ndarray (96, 2), list of the run times of its columns), NaN when there is no log
+    """
+    values = np.full((funcs.N_SLOTS, 2), np.nan)
+    try:
+        data = funcs.read_excel_sheets(destination=log_path, date=date, site=site)
+    except FileNotFoundError:
+        return values, []
+    if not isinstance(data, pd.DataFrame):
+        return values, []
+    data = data.iloc[:funcs.N_SLOTS, -2:]
+    values[:len(data.index), :len(data.columns)] = data.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    return values, [str(col) for col in data.columns]
+
+
+def to_export_frame(date, site, values, logs, runs):
+    """
+    Rows of a site-day with the columns of COLUMNS
+    :param date: str '%d-%m-%Y'
+    :param values: np.ndarray (96, len(funcs.RANGE_COLUMNS))
+    :param logs: np.ndarray (96, 2) and runs: list of their run times, see read_logs
+    :return: pd.DataFrame or None when the site has no data that day
+    """
+    # Rounded like the frames of funcs.assemble_frame
+    values = np.hstack([values, logs]).round(2)
+    if np.isnan(values).all():
+        return None
+
+    frame = pd.DataFrame(values, columns=VALUE_COLUMNS)
+    frame.insert(0, 'Date', datetime.datetime.strptime(date, '%d-%m-%Y').date().isoformat())
+    frame.insert(1, 'Time', list(funcs.TIME_INDEX))
+    frame.insert(2, 'Site', site)
+    frame['Log 1 Run'], frame['Log 2 Run'] = runs + [None] * (2 - len(runs))
+    return frame
+
+
+def iter_days(sites, start_date, end_date):
+    """
+    Yields the export rows of every date of the range, one pd.DataFrame of all the sites per date.
+    The four csv sources of a date are read once for all the sites, then one log read per site. A site
+    missing from the files of a date (added or retired since) has NaN values that day, or no rows at all.
+    Only the dates having a file in one of the source folders are read.
+    Read without the data cache so a bulk export does not evict the entries of the dashboard.
+    """
+    real_path, intra_day_path, day_ahead_ensemble_path, satellite_forecast_path, log_path = funcs.get_source_paths()
+    for date in funcs.get_dates_with_files(funcs.get_source_paths(), start_date, end_date):
+        fleet_sites, blocks = funcs.read_fleet_for_date(real_path=real_path,
+                                                        intra_day_path=intra_day_path,
+                                                        day_ahead_ensemble_path=day_ahead_ensemble_path,
+                                                        satellite_forecast_path=satellite_forecast_path,
+                                                        date=date)
+        fleet = np.stack([blocks[col] for col in funcs.RANGE_COLUMNS], axis=2)
+        positions = {site: i for i, site in enumerate(fleet_sites)}
+
+        frames = []
+        for site in sites:
+            if site in positions:
+                values = fleet[:, positions[site]]
+            else:
+                values = np.full((funcs.N_SLOTS, len(funcs.RANGE_COLUMNS)), np.nan)
+            logs, runs = read_logs(log_path, date, site)
+            frame = to_export_frame(date, site, values, logs, runs)
+            if frame is not None:
+                frames.append(frame)
+        if frames:
+            yield pd.concat(frames, ignore_index=True)
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    File object the pyarrow writers write to, what was written so far is taken out with drain()
+    """
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _get_schema():
+    fields = [pa.field(col, pa.string()) for col in ['Date', 'Time', 'Site']]
+    fields += [pa.field(col, pa.float64()) for col in VALUE_COLUMNS]
+    fields += [pa.field(col, pa.string()) for col in ['Log 1 Run', 'Log 2 Run']]
+    return pa.schema(fields)
+
+
+def stream_csv(days):
+    header = True
+    for frame in days:
+        yield frame.to_csv(index=False, header=header)
+        header = False
+    if header:
+        yield ','.join(COLUMNS) + '\n'
+
+
+def stream_pyarrow(days, new_writer):
+    """
+    :param new_writer: function(sink, schema) returning a writer with write_table and close
+    """
+    schema = _get_schema()
+    sink = _ChunkSink()
+    writer = new_writer(sink, schema)
+    for frame in days:
+        writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    writer.close()
+    yield sink.drain()
+
+
+def stream_export(sites, start_date, end_date, fmt):
+    """
+    Generator of the encoded chunks of the export, to use as the body of a streamed response
+    """
+    instrumentation.inc('exports_total', format=fmt)
+    days = iter_days(sites, start_date, end_date)
+    if fmt == 'csv':
+        chunks = (chunk.encode() for chunk in stream_csv(days))
+    elif fmt == 'parquet':
+        chunks = stream_pyarrow(days, pq.ParquetWriter)
+    else:
+        chunks = stream_pyarrow(days, pa.ipc.new_stream)
+    for chunk in chunks:
+        instrumentation.inc('export_bytes_total', len(chunk), format=fmt)
+        yield chunk
@@ -2,15 +2,169 @@
 functions to support the dashboard i/o
 """
 import os
+import re
+import json
+import time
+import bisect
+import logging
 import datetime
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, Future
 import pandas as pd
 import numpy as np
+import config
+import store
+import archive
+import shared_cache
+import instrumentation
 
+logger = logging.getLogger(__name__)
 
-def get_file_name_for_date(search_folder, date_=None):
+# Bounded pool used to read the sources of a (date, site) concurrently
+_read_pool = ThreadPoolExecutor(max_workers=config.READ_WORKERS, thread_name_prefix='source-read')
+
+# 15 min slots of a day, 'HH:MM' labels shared by every frame
+N_SLOTS = 96
+TIME_INDEX = pd.Index(pd.date_range(start='1/1/2018', periods=N_SLOTS, freq='15T').strftime('%H:%M'))
+
+# Process-wide cache of merged frames -> {(date, site, paths): (version, expires_at, frame)}
+_data_cache = OrderedDict()
+_data_cache_lock = threading.Lock()
+
+# dates: sorted list of the datetime.date having a file, files: {'%d-%m-%Y': file name or None if ambiguous}
+DateIndex = namedtuple('DateIndex', ['dates', 'files'])
+
+# In-memory date index per source folder -> {(folder, source type): (dir_mtime, scanned_at, DateIndex)}
+_dir_index = {}
+_dir_index_lock = threading.Lock()
+_DATE_GROUP = r'(?P<day>\d{2})-(?P<month>\d{2})-(?P<year>\d{4})'
+
+# config.FILE_PATTERNS compiled once -> {source type: [compiled patterns in order of precedence]}
+FILE_PATTERNS = {source_type: [re.compile(pattern.replace('{date}', _DATE_GROUP), re.IGNORECASE)
+                               for pattern in patterns]
+                 for source_type, patterns in config.FILE_PATTERNS.items()}
+
+# Computations running in this process, shared by the threads asking for the same key -> {key: flight dict}
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+# Site and date options of the dashboard -> dict(sites, min_date, max_date), see get_dashboard_options
+_options = None
+_options_lock = threading.Lock()
+_options_thread = None
+
+
+def parse_file_name(file_name, patterns):
+    """
+    Strictly parses the date of a daily file name
+    :param patterns: list of compiled patterns in order of precedence
+    :return: tuple(date, rank of the matching pattern) or None when no pattern matches or the date is invalid
+    """
+    for rank, pattern in enumerate(patterns):
+        match = pattern.fullmatch(file_name)
+        if match is not None:
+            try:
+                return datetime.date(int(match['year']), int(match['month']), int(match['day'])), rank
+            except ValueError:
+                return None
+    return None
+
+
+def single_flight(key, compute):
+    """
+    Runs compute() once for all the threads asking for the same key at the same time: the first one computes,
+    the others wait for it and share its result (or its exception). Nothing is kept once it is done.
+    :param key: hashable, e.g. ('data', date, site, version)
+    :param compute: function without arguments
+    :return: the result of compute()
+    """
+    with _in_flight_lock:
+        flight = _in_flight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _in_flight[key] = dict(done=threading.Event())
+    if not leader:
+        instrumentation.inc('coalesced_requests_total', kind=str(key[0]))
+        flight['done'].wait()
+        if 'error' in flight:
+            raise flight['error']
+        return flight['result']
+
+    try:
+        flight['result'] = compute()
+        return flight['result']
+    except Exception as e:
+        flight['error'] = e
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+        flight['done'].set()
+
+
+def _scan_dir(search_folder, source_type):
+    """
+    Lists a folder once and indexes its daily files on their date. A date with several files keeps the one
+    of the pattern of highest precedence, between files of the same pattern config.DUPLICATE_FILES decides.
+    :param search_folder: The folder to scan
+    :param source_type: key of FILE_PATTERNS for the files of the folder, 'csv' or 'log'
+    :return: DateIndex
+    """
+    patterns = FILE_PATTERNS[source_type]
+    candidates = {}
+    with os.scandir(search_folder) as entries:
+        for entry in entries:
+            parsed = parse_file_name(entry.name, patterns)
+            if parsed is not None:
+                candidates.setdefault(parsed[0], []).append((parsed[1], entry))
+
+    files = {}
+    for date, entries in candidates.items():
+        best_rank = min(rank for rank, _ in entries)
+        best = [entry for rank, entry in entries if rank == best_rank]
+        if len(best) == 1:
+            file_name = best[0].name
+        elif config.DUPLICATE_FILES == 'newest':
+            file_name = max(best, key=lambda entry: (entry.stat().st_mtime_ns, entry.name)).name
+        else:
+            logger.warning(f"Several files for {date} in {search_folder}: {sorted(entry.name for entry in best)}")
+            file_name = None
+        files[date.strftime('%d-%m-%Y')] = file_name
+    dates = sorted(date for date, entries in candidates.items() if files[date.strftime('%d-%m-%Y')] is not None)
+    return DateIndex(dates=dates, files=files)
+
+
+def get_dir_index(search_folder, source_type='csv'):
+    """
+    Returns the index of a folder, rebuilding it only when the folder mtime has changed (a file was added,
+    removed or renamed) or it is older than config.DIR_INDEX_MAX_AGE, so a lookup usually costs one stat
+    :param search_folder: The folder to index
+    :param source_type: key of FILE_PATTERNS for the files of the folder, 'csv' or 'log'
+    :return: DateIndex
+    """
+    dir_mtime = os.stat(search_folder).st_mtime_ns
+    now = time.monotonic()
+    with _dir_index_lock:
+        entry = _dir_index.get((search_folder, source_type))
+    if entry is not None and entry[0] == dir_mtime and now - entry[1] < config.DIR_INDEX_MAX_AGE:
+        instrumentation.count_cache('dir_index', hit=True)
+        return entry[2]
+
+    instrumentation.count_cache('dir_index', hit=False)
+    with instrumentation.timer('stage_seconds', stage='dir_scan'):
+        index = _scan_dir(search_folder, source_type)
+    with _dir_index_lock:
+        _dir_index[(search_folder, source_type)] = (dir_mtime, now, index)
+    return index
+
+
+def get_file_name_for_date(search_folder, date_=None, source_type='csv'):
     """
     Finds the file name for the todays date
     :param search_folder: The destination folder to search
+    :param date_: str '%d-%m-%Y', today if None
+    :param source_type: 'csv' or 'log', see get_dir_index
     :return: str, file_name
     """
     if date_ is None:
@@ -18,23 +172,67 @@ def get_file_name_for_date(search_folder, date_=None):
     else:
         today_date = date_
 
-    files_ = [file for file in os.listdir(search_folder) if today_date in file]
-    if len(files_) == 1:
-        return files_[0]
-    else:
+    file_name = get_dir_index(search_folder, source_type).files.get(today_date)
+    if file_name is None:
         raise FileNotFoundError(f"Unable to find a unique file for {today_date} in {search_folder}")
+    return file_name
+
+
+def get_dates_between(search_folder, start_date, end_date, source_type='csv'):
+    """
+    Dates having a file in a folder, from start_date to end_date (both included)
+    :param start_date: datetime.date
+    :param end_date: datetime.date
+    :param source_type: 'csv' or 'log', see get_dir_index
+    :return: list of datetime.date
+    """
+    dates = get_dir_index(search_folder, source_type).dates
+    return dates[bisect.bisect_left(dates, start_date):bisect.bisect_right(dates, end_date)]
+
+
+def get_dates_with_files(paths, start_date, end_date):
+    """
+    Dates of a range having a file in at least one of several source folders, taken from their sorted indexes
+    so the days without any file are never looked up
+    :param paths: iterable of source folders in the order of get_source_paths, see get_date_version
+    :param start_date: datetime.date
+    :param end_date: datetime.date
+    :return: list of '%d-%m-%Y' dates in order
+    """
+    dates = set()
+    for path, source_type in zip(paths, SOURCE_TYPES):
+        try:
+            dates.update(get_dates_between(path, start_date, end_date, source_type=source_type))
+        except OSError:
+            logger.debug(f"Unable to index {path}")
+    return [date.strftime('%d-%m-%Y') for date in sorted(dates)]
+
 
+def get_nearest_date(search_folder, date):
+    """
+    Date having a file in a folder closest to date, the earlier one on a tie
+    :param date: datetime.date
+    :return: datetime.date or None when the folder has no file
+    """
+    dates = get_dir_index(search_folder).dates
+    if not dates:
+        return None
+    position = bisect.bisect_left(dates, date)
+    neighbours = dates[max(position - 1, 0):position + 1]
+    return min(neighbours, key=lambda neighbour: abs((neighbour - date).days))
 
-def get_site_options(destination):
+
+def get_site_options(destination, date_=None):
     """
     Extract the Site options to show on the dashboard from Real-> file containing actual solar values
 
     :param destination: The folder to search
+    :param date_: str '%d-%m-%Y' of the file to use, today if None
     :return: dict of value:label for these options
     :rtype: dict
     """
-    file_name = get_file_name_for_date(search_folder=destination, date_=None)
-    file_ = pd.read_csv(os.path.join(destination, file_name))
+    file_name = get_file_name_for_date(search_folder=destination, date_=date_)
+    file_ = pd.read_csv(os.path.join(destination, file_name), nrows=0)
     cols = sorted([col for col in file_.columns if 'Time' not in col])
     return [dict(label=t, value=t) for t in cols]
 
@@ -46,36 +244,105 @@ def get_today_date(date_or_str='date'):
         return datetime.datetime.today().date().strftime('%d-%m-%Y')
 
 
-def get_dates_in_dir(destination):
-    return [file.split('.')[0] for file in os.listdir(destination) if os.path.isfile(os.path.join(destination, file))]
-
-
-def get_min_max_dates(verbose=False, *args):
+def get_min_max_dates(verbose=False, *args, log_path=None):
     """
     Extract minimum and maximum date available for dashboard
     :param args: *args are the destination to search for files to search the min date
+    :param log_path: The folder of the log workbooks, also searched when given
     :return: tuple(minimum_date, maximum_date)
     """
-    dirs = [dest for dest in args]
+    indexes = [get_dir_index(one_dir) for one_dir in args]
+    if log_path is not None:
+        indexes.append(get_dir_index(log_path, source_type='log'))
+        args += (log_path,)
+    dates_ = [index.dates for index in indexes if index.dates]
+    if not dates_:
+        raise FileNotFoundError(f"No daily file in {', '.join(args)}")
+    if verbose:
+        print(f"{sum(len(dates) for dates in dates_)} daily files in {len(args)} folders")
+    return min(dates[0] for dates in dates_), max(dates[-1] for dates in dates_)
+
+
+def discover_options(real_path, *date_dirs, log_path=None):
+    """
+    Scans the source folders for the options of the dashboard
+    :param real_path: The folder of the actuals, the sites are read from its latest file
+    :param date_dirs: The csv folders bounding the dates of the date pickers
+    :param log_path: The log folder also bounding them, if any
+    :return: dict(sites=list, min_date=str, max_date=str, default_date=str of the date with actuals nearest to
+             today) with the dates as '%Y-%m-%d'
+    """
+    min_date, max_date = get_min_max_dates(False, *date_dirs, log_path=log_path)
+    latest_real = get_min_max_dates(False, real_path)[1]
+    sites = [option['value'] for option in get_site_options(destination=real_path,
+                                                             date_=latest_real.strftime('%d-%m-%Y'))]
+    default_date = get_nearest_date(real_path, get_today_date())
+    return dict(sites=sites, min_date=min_date.isoformat(), max_date=max_date.isoformat(),
+                default_date=default_date.isoformat())
 
-    all_files = []
-    for one_dir in dirs:
-        files_ = get_dates_in_dir(one_dir)
-        all_files.append(files_)
 
-    flat_list = [item for sublist in all_files for item in sublist]
-    dates_ = []
-    for item in flat_list:
-        if 'log' not in item and 'scaled' not in item and len(item) > 1 and 'copy' not in item:
-            try:
-                date_date = datetime.datetime.strptime(item, '%d-%m-%Y')
-                dates_.append(date_date)
-            except ValueError as ve:
-                if verbose:
-                    print(f"Unable to parse {item}, {ve}")
+def load_options_snapshot(snapshot_path):
+    try:
+        with open(snapshot_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_options_snapshot(snapshot_path, options):
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(options, f)
+    os.replace(tmp_path, snapshot_path)
+
 
-    dates_ = list(set(dates_))
-    return min(dates_).date(), max(dates_).date()
+def get_dashboard_options(snapshot_path):
+    """
+    Options of the dashboard without touching the source folders: the last discovered ones, else the snapshot
+    persisted by the previous discovery, else only today until the background discovery completes
+    :param snapshot_path: The json snapshot written by refresh_dashboard_options
+    :return: dict(sites=list, min_date=str, max_date=str, default_date=str)
+    """
+    global _options
+    with _options_lock:
+        if _options is None:
+            today = get_today_date().isoformat()
+            _options = load_options_snapshot(snapshot_path) or dict(sites=[], min_date=today, max_date=today,
+                                                                    default_date=today)
+        return _options
+
+
+def refresh_dashboard_options(snapshot_path, real_path, *date_dirs, log_path=None):
+    global _options
+    options = discover_options(real_path, *date_dirs, log_path=log_path)
+    with _options_lock:
+        _options = options
+    save_options_snapshot(snapshot_path, options)
+    return options
+
+
+def _run_options_discovery(snapshot_path, real_path, date_dirs, log_path):
+    while True:
+        start = time.perf_counter()
+        try:
+            refresh_dashboard_options(snapshot_path, real_path, *date_dirs, log_path=log_path)
+            logger.debug(f"Options discovery in {time.perf_counter() - start:.2f}s")
+        except Exception:
+            logger.exception("Options discovery failed")
+        time.sleep(config.OPTIONS_REFRESH_SECS)
+
+
+def start_options_discovery(snapshot_path, real_path, *date_dirs, log_path=None):
+    """
+    Starts the background thread keeping the dashboard options and their snapshot current
+    """
+    global _options_thread
+    if _options_thread is None:
+        _options_thread = threading.Thread(target=_run_options_discovery,
+                                           args=(snapshot_path, real_path, date_dirs, log_path),
+                                           name='options-discovery', daemon=True)
+        _options_thread.start()
+    return _options_thread
 
 
 def get_outputs_to_show():
@@ -83,77 +350,501 @@ def get_outputs_to_show():
     return [dict(label=t, value=t) for t in vals]
 
 
+def nan_series():
+    """
+    Stands for a source without data for a (date, site)
+    """
+    return pd.Series(np.repeat(np.nan, N_SLOTS))
+
+
 def read_csv_data(destination, date, site=None):
+    """
+    :param site: The site column, the whole file if None. A site missing from the file of that day
+                 (added or retired since) gives a NaN series.
+    """
     file_name = get_file_name_for_date(search_folder=destination, date_=date)
-    data = pd.read_csv(os.path.join(destination, file_name))
+    file_path = os.path.join(destination, file_name)
     if site is not None:
+        # Columnar store first, the csv is the fallback when it is disabled or stale
+        column = store.read_column(source_file=file_path, site=site)
+        if column is not None:
+            instrumentation.count_file_read(store.get_store_file(file_path), kind='store')
+            return column[:95]
+
+    instrumentation.count_file_read(file_path, kind='csv')
+    data = pd.read_csv(file_path)
+    if site is not None:
+        if site not in data.columns:
+            logger.debug(f"No {site} column in {file_path}")
+            return nan_series()
         data = data[site][:95]
 
     return data
 
 
 def read_excel_sheets(destination, date, site):
-    file_name = get_file_name_for_date(search_folder=destination, date_=date)
-    data = pd.read_excel(os.path.join(destination, file_name), engine='openpyxl', sheet_name=None)
-    site_data = data.get(site).iloc[:, -2:]
+    file_name = get_file_name_for_date(search_folder=destination, date_=date, source_type='log')
+    file_path = os.path.join(destination, file_name)
+    site_data = store.read_log_sheet(source_file=file_path, site=site)
+    if site_data is not None:
+        instrumentation.count_file_read(store.get_store_file(file_path), kind='store')
+        if site_data is store.NO_SHEET:
+            logger.debug(f"No {site} sheet in {file_path}")
+            return nan_series()
+        return site_data
+
+    # Store disabled (or without the sheet), only parse the sheet of the site
+    instrumentation.count_file_read(file_path, kind='xlsx')
+    try:
+        site_data = pd.read_excel(file_path, engine='openpyxl', sheet_name=site).iloc[:, -2:]
+    except ValueError:
+        logger.debug(f"No {site} sheet in {file_path}")
+        return nan_series()
     site_data.columns = [col[-8:] for col in site_data.columns]
     return site_data
 
 
+def read_all_sites(destination, date):
+    """
+    Every site column of a daily file in one read, from the columnar store when it is fresh
+    :param destination: The source folder
+    :param date: str '%d-%m-%Y'
+    :return: pd.DataFrame of the first 95 rows with one column per site
+    """
+    file_name = get_file_name_for_date(search_folder=destination, date_=date)
+    file_path = os.path.join(destination, file_name)
+    columns = store.read_all_columns(source_file=file_path)
+    if columns is not None:
+        instrumentation.count_file_read(store.get_store_file(file_path), kind='store')
+        return pd.DataFrame(columns)[:95]
+
+    instrumentation.count_file_read(file_path, kind='csv')
+    data = pd.read_csv(file_path)
+    return data[[col for col in data.columns if pd.api.types.is_numeric_dtype(data[col])]][:95]
+
+
+def read_fleet_for_date(real_path,
+                        intra_day_path,
+                        day_ahead_ensemble_path,
+                        satellite_forecast_path,
+                        date):
+    """
+    Actual and forecasts of every site of a date, each source file is read once and the reads run concurrently
+    :return: tuple(list of sites, dict of source: np.ndarray of shape (96, len(sites)))
+    """
+    sources = {'Actual': real_path,
+               'IntraDay': intra_day_path,
+               'Day Ahead Ensemble': day_ahead_ensemble_path,
+               'Satellite': satellite_forecast_path}
+    futures = {name: _submit_read(read_all_sites, destination=path, date=date)
+               for name, path in sources.items()}
+
+    frames = {}
+    for name, future in futures.items():
+        data, elapsed = future.result()
+        instrumentation.observe('source_read_seconds', elapsed, source=f"{name} (fleet)")
+        # A missing file comes back as a NaN series
+        frames[name] = data if isinstance(data, pd.DataFrame) else pd.DataFrame()
+
+    sites = sorted(set().union(*(frame.columns for frame in frames.values())))
+    blocks = {}
+    for name, frame in frames.items():
+        block = np.full((N_SLOTS, len(sites)), np.nan)
+        values = _as_float(frame.reindex(columns=sites))
+        block[:min(len(values), N_SLOTS)] = values[:N_SLOTS]
+        blocks[name] = block
+    return sites, blocks
+
+
+def assemble_site_from_fleet(sites, blocks, log_path, date, site):
+    """
+    Day frame of a site like read_all_data_for_date_site, from the csv sources already read for the whole
+    fleet and the log sheet of the site. A site missing from the fleet files has NaN csv columns.
+    :param sites: list of sites and blocks: dict of source: np.ndarray, see read_fleet_for_date
+    :param log_path: The log folder
+    :param date: str '%d-%m-%Y'
+    :return: pd.DataFrame
+    """
+    column = sites.index(site) if site in sites else None
+    sources = {name: nan_series() if column is None else pd.Series(block[:, column])
+               for name, block in blocks.items()}
+    sources['Logs'], _ = _timed_read(read_excel_sheets, destination=log_path, date=date, site=site)
+    return assemble_frame([(name, sources[name])
+                           for name in ['IntraDay', 'Day Ahead Ensemble', 'Satellite', 'Logs', 'Actual']])
+
+
+def _timed_read(reader, **kwargs):
+    """
+    Runs one source reader, a missing file gives a NaN series
+    :return: tuple(data, elapsed seconds)
+    """
+    start = time.perf_counter()
+    try:
+        data = reader(**kwargs)
+    except FileNotFoundError:
+        data = nan_series()
+    return data, time.perf_counter() - start
+
+
+def _submit_read(reader, **kwargs):
+    """
+    Runs _timed_read on the read pool, or inline in a profiled request so its profile sees the reads
+    :return: concurrent.futures.Future
+    """
+    if not instrumentation.is_profiling():
+        return _read_pool.submit(_timed_read, reader, **kwargs)
+    future = Future()
+    try:
+        future.set_result(_timed_read(reader, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
 def read_all_data_for_date_site(real_path,
                                 intra_day_path,
                                 day_ahead_ensemble_path,
                                 satellite_forecast_path,
                                 log_path,
                                 date,
-                                site):
+                                site,
+                                timings=None):
+    """
+    Reads all the sources of a date and site concurrently and merges them on the 15 min time axis.
+    A missing source is a NaN series.
+    :param log_path: The log folder, None to only read the four csv sources (no Logs columns)
+    :param timings: optional dict, filled with the read time in seconds of every source
+    :return: pd.DataFrame
+    """
+    sources = {'Actual': (read_csv_data, real_path),
+               'IntraDay': (read_csv_data, intra_day_path),
+               'Day Ahead Ensemble': (read_csv_data, day_ahead_ensemble_path),
+               'Satellite': (read_csv_data, satellite_forecast_path)}
+    if log_path is not None:
+        sources['Logs'] = (read_excel_sheets, log_path)
+    futures = {name: _submit_read(reader, destination=path, date=date, site=site)
+               for name, (reader, path) in sources.items()}
+
+    results = {}
+    for name, future in futures.items():
+        results[name], elapsed = future.result()
+        instrumentation.observe('source_read_seconds', elapsed, source=name)
+        if timings is not None:
+            timings[name] = elapsed
+        if elapsed > config.SLOW_READ_SECS:
+            logger.warning(f"Slow read of {name} for {date} {site}: {elapsed:.2f}s from {sources[name][1]}")
+        else:
+            logger.debug(f"Read {name} for {date} {site} in {elapsed:.3f}s")
+
+    with instrumentation.timer('stage_seconds', stage='assemble'):
+        return assemble_frame([(name, results[name])
+                               for name in ['IntraDay', 'Day Ahead Ensemble', 'Satellite', 'Logs', 'Actual']
+                               if name in results])
+
+
+def _as_float(values):
+    """
+    Float64 values of a Series/DataFrame, non numeric entries become NaN
+    """
+    if isinstance(values, pd.DataFrame):
+        if not all(pd.api.types.is_numeric_dtype(dtype) for dtype in values.dtypes):
+            values = values.apply(pd.to_numeric, errors='coerce')
+    elif not pd.api.types.is_numeric_dtype(values.dtype):
+        values = pd.to_numeric(values, errors='coerce')
+    return values.to_numpy(dtype=float, na_value=np.nan)
 
-    time_axis = pd.date_range(start='1/1/2018', periods=96, freq='15T').time
 
-    try:
-        real = read_csv_data(destination=real_path, date=date, site=site)
+def assemble_frame(sources):
+    """
+    Builds the 96 x n frame of a day by writing every source straight into a preallocated block, slots a
+    source does not cover stay NaN. A DataFrame source (Logs) contributes all of its columns.
+    :param sources: list of (name, pd.Series or pd.DataFrame) in column order
+    :return: pd.DataFrame indexed on TIME_INDEX, rounded to 2 decimals
+    """
+    columns, blocks = [], []
+    for name, data in sources:
+        values = _as_float(data)
+        if values.ndim == 1:
+            columns.append(name)
+            values = values[:, None]
+        else:
+            columns.extend(data.columns)
+        blocks.append(values)
+
+    block = np.full((N_SLOTS, len(columns)), np.nan)
+    start = 0
+    for values in blocks:
+        n_rows = min(len(values), N_SLOTS)
+        block[:n_rows, start:start + values.shape[1]] = values[:n_rows]
+        start += values.shape[1]
+    np.round(block, 2, out=block)
+    return pd.DataFrame(block, index=TIME_INDEX, columns=columns)
+
+
+def last_valid_slot(values):
+    """
+    Number of slots up to and including the last non NaN value
+    :param values: 1d np.ndarray
+    :return: int
+    """
+    valid = np.flatnonzero(~np.isnan(values))
+    return int(valid[-1]) + 1 if len(valid) else 0
 
-    except FileNotFoundError:
-        real = pd.Series(np.repeat(np.nan, 96))
 
-    try:
-        intraday = read_csv_data(destination=intra_day_path, date=date, site=site)
-    except FileNotFoundError:
-        intraday = pd.Series(np.repeat(np.nan, 96))
+def downsample_min_max(values, n_out):
+    """
+    Indices of the points to draw so a long series keeps its shape with at most n_out points: the min and the
+    max of n_out // 2 equal buckets. A bucket with no value keeps one NaN so gaps stay visible.
+    :param values: 1d np.ndarray
+    :param n_out: int, e.g. twice the plot width in pixels
+    :return: np.ndarray of sorted indices
+    """
+    n_values = len(values)
+    if n_values <= n_out:
+        return np.arange(n_values)
+    n_buckets = max(n_out // 2, 1)
+    size = -(-n_values // n_buckets)
+    buckets = np.full(n_buckets * size, np.nan)
+    buckets[:n_values] = values
+    buckets = buckets.reshape(n_buckets, size)
+    missing = np.isnan(buckets)
+
+    offsets = np.arange(n_buckets) * size
+    lows = offsets + np.argmin(np.where(missing, np.inf, buckets), axis=1)
+    highs = offsets + np.argmax(np.where(missing, -np.inf, buckets), axis=1)
+    keep = np.unique(np.concatenate([lows, highs]))
+    return keep[keep < n_values]
+
+
+def absolute_percentage_error(forecast, actual):
+    """
+    Vectorized |forecast - actual| / actual, slots with a zero Actual are NaN
+    :param forecast: np.ndarray
+    :param actual: np.ndarray broadcastable to forecast
+    :return: np.ndarray
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ape = np.abs(forecast - actual) / actual
+    ape[np.isinf(ape)] = np.nan
+    return ape
 
-    try:
-        da_ensemble = read_csv_data(destination=day_ahead_ensemble_path, date=date, site=site)
-    except FileNotFoundError:
-        da_ensemble = pd.Series(np.repeat(np.nan, 96))
 
-    try:
-        satellite = read_csv_data(destination=satellite_forecast_path, date=date, site=site)
-    except FileNotFoundError:
-        satellite = pd.Series(np.repeat(np.nan, 96))
+def nan_mean(values, axis=0):
+    """
+    Mean ignoring NaN, all-NaN slices give NaN without a RuntimeWarning
+    """
+    counts = np.sum(~np.isnan(values), axis=axis)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.nansum(values, axis=axis) / counts
+
+
+def iter_dates(start_date, end_date):
+    """
+    Yields the dates from start_date to end_date (both included) as '%d-%m-%Y'
+    :param start_date: datetime.date
+    :param end_date: datetime.date
+    """
+    for day in range((end_date - start_date).days + 1):
+        yield (start_date + datetime.timedelta(days=day)).strftime('%d-%m-%Y')
+
 
+def iter_site_days(real_path,
+                   intra_day_path,
+                   day_ahead_ensemble_path,
+                   satellite_forecast_path,
+                   dates,
+                   site,
+                   columns):
+    """
+    Streams the days of a site one at a time, only the requested columns of a day are kept.
+    Only the four csv sources are read, the log workbooks are never opened.
+    :param dates: iterable of '%d-%m-%Y' dates
+    :param columns: list of the columns to keep, out of RANGE_COLUMNS
+    :return: generator of (date, np.ndarray of shape (96, len(columns)))
+    """
+    for date in dates:
+        data = read_all_data_for_date_site(real_path=real_path,
+                                           intra_day_path=intra_day_path,
+                                           day_ahead_ensemble_path=day_ahead_ensemble_path,
+                                           satellite_forecast_path=satellite_forecast_path,
+                                           log_path=None,
+                                           date=date,
+                                           site=site)
+        yield date, data[columns].to_numpy()
+
+
+RANGE_COLUMNS = ['Actual', 'IntraDay', 'Day Ahead Ensemble', 'Satellite']
+
+
+def aggregate_date_range(real_path,
+                         intra_day_path,
+                         day_ahead_ensemble_path,
+                         satellite_forecast_path,
+                         start_date,
+                         end_date,
+                         site):
+    """
+    Actual and forecasts of a site over a date range together with the daily MAPE of every forecast.
+    Days are streamed and written into preallocated arrays, so no raw day frame is kept around.
+    :param start_date: datetime.date
+    :param end_date: datetime.date
+    :return: tuple(pd.DataFrame of the 15 min values on a DatetimeIndex, pd.DataFrame of daily MAPE)
+    """
+    dates = list(iter_dates(start_date, end_date))
+    forecasts = RANGE_COLUMNS[1:]
+    values = np.full((len(dates), N_SLOTS, len(RANGE_COLUMNS)), np.nan)
+
+    # Days without any file stay NaN, only the others are looked up
+    paths = (real_path, intra_day_path, day_ahead_ensemble_path, satellite_forecast_path)
+    with_files = set(get_dates_with_files(paths, start_date, end_date))
+
+    # Days still matching their source files come from the archive, the others from the files
+    archived = np.zeros(len(dates), dtype=bool)
+    history = archive.read_site_history(site, start_date, end_date)
+    if history is not None:
+        archived = np.array([date in with_files and version is not None
+                             and version == get_date_version(paths=paths, date=date)
+                             for date, version in zip(dates, history[0])])
+        for j, col in enumerate(RANGE_COLUMNS):
+            values[archived, :, j] = history[1][col][archived]
+
+    positions = {date: i for i, date in enumerate(dates)}
+    days = iter_site_days(real_path=real_path,
+                          intra_day_path=intra_day_path,
+                          day_ahead_ensemble_path=day_ahead_ensemble_path,
+                          satellite_forecast_path=satellite_forecast_path,
+                          dates=[date for date, done in zip(dates, archived) if date in with_files and not done],
+                          site=site,
+                          columns=RANGE_COLUMNS)
+    for date, day in days:
+        values[positions[date]] = day
+
+    mape = nan_mean(absolute_percentage_error(values[:, :, 1:], values[:, :, :1]), axis=1)
+    values = values.reshape(len(dates) * N_SLOTS, len(RANGE_COLUMNS))
+
+    index = pd.date_range(start=start_date, periods=len(dates) * N_SLOTS, freq='15T')
+    day_index = pd.DatetimeIndex(pd.to_datetime(dates, format='%d-%m-%Y'), name='Date')
+    return (pd.DataFrame(values, index=index, columns=RANGE_COLUMNS),
+            pd.DataFrame(mape, index=day_index, columns=forecasts))
+
+
+def compact_archive(start_date, end_date):
+    """
+    Appends the days of the range having files to the rolling archive, a day already archived is only rewritten
+    when one of its source files changed since
+    :param start_date: datetime.date
+    :param end_date: datetime.date, a finished day
+    :return: int, number of days written
+    """
+    paths = get_source_paths()[:4]
+    _, archived = archive.get_index()
+    days = []
+    for date in get_dates_with_files(paths, start_date, end_date):
+        day = datetime.datetime.strptime(date, '%d-%m-%Y').date()
+        version = get_date_version(paths=paths, date=date)
+        if archived.get(archive.get_slot(day)) == (day, version):
+            continue
+        sites, blocks = read_fleet_for_date(*paths, date=date)
+        # Rounded like the frames of assemble_frame
+        days.append((day, version, sites, {source: block.round(2) for source, block in blocks.items()}))
+    return archive.write_days(days)
+
+
+def get_source_version(search_folder, date_, source_type='csv'):
+    """
+    Version stamp of the file backing a date in a source folder
+    :param search_folder: The source folder
+    :param date_: str date in '%d-%m-%Y'
+    :param source_type: 'csv' or 'log', see get_dir_index
+    :return: int mtime in ns, or None if there is no (unique) file for the date
+    """
     try:
-        log_data = read_excel_sheets(destination=log_path, date=date, site=site)
-    except FileNotFoundError:
-        log_data = pd.Series(np.repeat(np.nan, 96))
-
-
-    intraday.name = 'IntraDay'
-    real.name = 'Actual'
-    da_ensemble.name = 'Day Ahead Ensemble'
-    satellite.name = 'Satellite'
-    log_data.name = 'Logs'
-
-    temp_1 = pd.merge(left=intraday, right=da_ensemble, left_index=True, right_index=True, how='outer')
-    temp_2 = pd.merge(left=temp_1, right=satellite, left_index=True, right_index=True, how='outer')
-    temp_3 = pd.merge(left=temp_2, right=log_data, left_index=True, right_index=True, how='outer')
-    temp_4 = pd.merge(left=temp_3, right=real, left_index=True, right_index=True, how='outer')
-    temp_4 = temp_4.fillna(np.nan)
-
-    def map_index_fun(x): return x.strftime('%H:%M')
-    time_axis = [map_index_fun(x) for x in time_axis]
-    temp_4.index = time_axis
-    temp_4 = temp_4.round(2)
-    return temp_4
+        file_name = get_file_name_for_date(search_folder=search_folder, date_=date_, source_type=source_type)
+        return os.stat(os.path.join(search_folder, file_name)).st_mtime_ns
+    except (FileNotFoundError, OSError):
+        return None
+
+
+def get_date_version(paths, date):
+    """
+    Version of a date over several source folders
+    :param paths: iterable of source folders in the order of get_source_paths, the four csv ones optionally
+                  followed by the log folder
+    :param date: str '%d-%m-%Y'
+    :return: tuple of get_source_version
+    """
+    return tuple(get_source_version(search_folder=path, date_=date, source_type=source_type)
+                 for path, source_type in zip(paths, SOURCE_TYPES))
+
+
+# Key of FILE_PATTERNS of every folder of get_source_paths
+SOURCE_TYPES = ('csv', 'csv', 'csv', 'csv', 'log')
+
+
+def get_source_paths():
+    """
+    Source folders of config in the (real, intra day, day ahead, satellite, logs) order
+    """
+    return (config.real_path, config.intra_day_path, config.day_ahead_ensemble_path,
+            config.satellite_forecast_path, config.logs_path)
+
+
+def get_data_for_date_site(real_path,
+                           intra_day_path,
+                           day_ahead_ensemble_path,
+                           satellite_forecast_path,
+                           log_path,
+                           date,
+                           site):
+    """
+    Cached version of read_all_data_for_date_site shared by all the callbacks of the process.
+    An entry is keyed on (date, site, source paths) and is only reused while the mtimes of the source files
+    are unchanged and it is younger than config.DATA_CACHE_TTL. At most config.DATA_CACHE_SIZE entries are
+    kept, least recently used ones are evicted first. A miss is looked up in the shared_cache of all the
+    workers before reading the files.
+    :return: pd.DataFrame, a copy callers are free to modify
+    """
+    paths = (real_path, intra_day_path, day_ahead_ensemble_path, satellite_forecast_path, log_path)
+    key = (date, site, paths)
+    version = get_date_version(paths=paths, date=date)
+    now = time.monotonic()
+
+    with _data_cache_lock:
+        entry = _data_cache.get(key)
+        if entry is not None and entry[0] == version and entry[1] > now:
+            _data_cache.move_to_end(key)
+            instrumentation.count_cache('data', hit=True)
+            return entry[2].copy()
+    instrumentation.count_cache('data', hit=False)
+
+    def load():
+        # Another worker may already have read it
+        data = shared_cache.get('data', key, version)
+        instrumentation.count_cache('shared_data', hit=data is not None)
+        if data is None:
+            data = read_all_data_for_date_site(real_path=real_path,
+                                               intra_day_path=intra_day_path,
+                                               day_ahead_ensemble_path=day_ahead_ensemble_path,
+                                               satellite_forecast_path=satellite_forecast_path,
+                                               log_path=log_path,
+                                               date=date,
+                                               site=site)
+            shared_cache.put('data', key, version, data)
+
+        with _data_cache_lock:
+            _data_cache[key] = (version, now + config.DATA_CACHE_TTL, data)
+            _data_cache.move_to_end(key)
+            while len(_data_cache) > config.DATA_CACHE_SIZE:
+                _data_cache.popitem(last=False)
+        return data
+
+    # The callbacks of the screens showing the same view at the same moment share one read
+    return single_flight(('data', key, version), load).copy()
+
+
+def clear_data_cache():
+    with _data_cache_lock:
+        _data_cache.clear()
 
 
 def get_current_time(form='%d %B %Y %H:%M:%S'):
@@ -0,0 +1,14 @@
+"""
+gunicorn settings of the production dashboard, see wsgi.py
+"""
+# Names only, a module level `config` would be taken for gunicorn's own setting
+from config import HOST, PORT, WORKERS, WORKER_THREADS
+
+bind = f"{HOST}:{PORT}"
+workers = WORKERS
+threads = WORKER_THREADS
+worker_class = 'gthread'
+timeout = 120
+# Each worker imports main itself so its background threads (options discovery, metrics engine) start in it
+preload_app = False
+accesslog = '-'
@@ -0,0 +1,155 @@
+"""
+Counters and timers of the hot paths (source reads, folder scans, caches, callbacks), exposed in the
+Prometheus text format on /metrics. Values are per process, with several gunicorn workers each one reports
+its own (the pid label tells them apart).
+
+Single requests can be profiled with cProfile when config.PROFILING_ENABLED: add ?profile=1 to the url or
+arm the next N requests with /debug/profile?requests=N, the stats are written to config.profile_path.
+cProfile only sees its own thread, so the source reads of a profiled request run inline (see is_profiling).
+"""
+import os
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+import config
+
+PREFIX = 'solar_dash_'
+
+# {(name, labels): value} and {(name, labels): [count, sum]}
+_counters = {}
+_summaries = {}
+_lock = threading.Lock()
+_armed_profiles = 0
+# Set in the thread of a request being profiled
+_profiling = threading.local()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """
+    Adds value to the counter name{labels}
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """
+    Records a duration in the summary name{labels}
+    """
+    key = _key(name, labels)
+    with _lock:
+        summary = _summaries.setdefault(key, [0, 0.0])
+        summary[0] += 1
+        summary[1] += seconds
+
+
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def count_file_read(path, kind):
+    """
+    Counts a file read and its size in bytes
+    :param kind: str, e.g. 'csv', 'xlsx' or 'store'
+    """
+    try:
+        size = os.stat(path).st_size
+    except OSError:
+        return
+    inc('file_reads_total', kind=kind)
+    inc('file_read_bytes_total', size, kind=kind)
+
+
+def count_cache(cache, hit):
+    inc('cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+def _labels_text(labels):
+    labels = labels + (('pid', str(os.getpid())),)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+def render():
+    """
+    All the counters and summaries in the Prometheus text exposition format
+    :return: str
+    """
+    with _lock:
+        counters = sorted(_counters.items())
+        summaries = sorted(_summaries.items())
+
+    lines = []
+    typed = set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            typed.add(name)
+        lines.append(f"{PREFIX}{name}{_labels_text(labels)} {value}")
+    for (name, labels), (count, total) in summaries:
+        if name not in typed:
+            lines.append(f"# TYPE {PREFIX}{name} summary")
+            typed.add(name)
+        lines.append(f"{PREFIX}{name}_count{_labels_text(labels)} {count}")
+        lines.append(f"{PREFIX}{name}_sum{_labels_text(labels)} {total:.6f}")
+    return '\n'.join(lines) + '\n'
+
+
+def arm_profiler(n_requests):
+    global _armed_profiles
+    with _lock:
+        _armed_profiles = n_requests
+
+
+def should_profile(requested):
+    """
+    Whether to profile the current request: asked for with ?profile=1 or one of the armed requests
+    """
+    global _armed_profiles
+    if not config.PROFILING_ENABLED:
+        return False
+    if requested:
+        return True
+    with _lock:
+        if _armed_profiles > 0:
+            _armed_profiles -= 1
+            return True
+    return False
+
+
+def is_profiling():
+    """
+    Whether the current thread is profiled, its work must then not be handed to other threads
+    """
+    return getattr(_profiling, 'active', False)
+
+
+def start_profile():
+    profile = cProfile.Profile()
+    _profiling.active = True
+    profile.enable()
+    return profile
+
+
+def stop_profile(profile, request_name):
+    """
+    Writes the stats of the profile, open them with pstats or snakeviz
+    :return: str, path of the stats file
+    """
+    profile.disable()
+    _profiling.active = False
+    os.makedirs(config.profile_path, exist_ok=True)
+    file_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{request_name.strip('/').replace('/', '_')}.prof"
+    path = os.path.join(config.profile_path, file_name)
+    profile.dump_stats(path)
+    return path
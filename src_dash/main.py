@@ -4,32 +4,133 @@ main dash run app
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
+import dash_table
+import os
 import datetime
-from dash.dependencies import Input, Output
+import hashlib
+import flask
+import threading
+from collections import OrderedDict
+from dash import no_update
+from dash.dependencies import Input, Output, State
 import plotly.express as px
 import plotly.graph_objects as go
-from numpy import inf, nan
+import numpy as np
 import funcs
 import config
+import metrics
+import watcher
+import instrumentation
+import export
+import prewarm
 
 app = dash.Dash(__name__, meta_tags=[{"name": "viewport", "content": "width=device-width"}])
 server = app.server
 
+# Rendered figures per (view, data version) -> {(key, version): entry}
+_figure_cache = OrderedDict()
+_figure_cache_lock = threading.Lock()
+
 app_colors = {'background': config.GRAPH_BG,
               'text': '#cccccc',
               'grid': config.GRID_COL,
               'axis': "#323130"}
 
 # DEF OPTIONS
-site_options = funcs.get_site_options(destination=config.real_path)
-min_date, max_date = funcs.get_min_max_dates(config.real_path,
-                                             config.logs_path,
-                                             config.day_ahead_ensemble_path,
-                                             config.satellite_forecast_path)
 output_lines = funcs.get_outputs_to_show()
+default_outputs = ['Actual', 'Day Ahead Ensemble', 'IntraDay']
+
+
+def get_sites():
+    return funcs.get_dashboard_options(config.options_snapshot_path)['sites']
+
+
+# Under `python main.py` the Werkzeug reloader imports this module in a parent process that only restarts the
+# serving child process (run with WERKZEUG_RUN_MAIN set), the background tasks belong to the child
+is_reloader_parent = __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+run_background_tasks = config.BACKGROUND_TASKS and not is_reloader_parent
+
+# Sites and dates are served from the last snapshot and refreshed in the background
+option_dirs = (config.real_path, config.real_path, config.day_ahead_ensemble_path, config.satellite_forecast_path)
+if run_background_tasks:
+    funcs.start_options_discovery(config.options_snapshot_path, *option_dirs, log_path=config.logs_path)
+    metrics.start_engine(get_sites=get_sites)
+    watcher.start_watcher()
+elif not is_reloader_parent:
+    # Without the background threads the options are discovered once, at startup
+    try:
+        funcs.refresh_dashboard_options(config.options_snapshot_path, *option_dirs, log_path=config.logs_path)
+    except (OSError, ValueError) as e:
+        server.logger.warning(f"Options discovery failed: {e}")
+
+
+@server.route('/metrics')
+def metrics_endpoint():
+    return flask.Response(instrumentation.render(), mimetype='text/plain; version=0.0.4')
+
+
+@server.route('/debug/profile')
+def arm_profiler():
+    """
+    Profiles the next ?requests=N requests of this worker, see instrumentation
+    """
+    if not config.PROFILING_ENABLED:
+        flask.abort(404)
+    n_requests = flask.request.args.get('requests', default=1, type=int)
+    instrumentation.arm_profiler(n_requests)
+    return f"Profiling the next {n_requests} requests to {config.profile_path}\n"
+
+
+@server.before_request
+def start_request_profile():
+    if flask.request.path in ('/metrics', '/debug/profile', '/events', '/export'):
+        return
+    if instrumentation.should_profile(requested=flask.request.args.get('profile') == '1'):
+        flask.g.profile = instrumentation.start_profile()
+
+
+@server.after_request
+def stop_request_profile(response):
+    profile = flask.g.pop('profile', None)
+    if profile is not None:
+        path = instrumentation.stop_profile(profile, flask.request.path)
+        server.logger.info(f"Profile of {flask.request.path} written to {path}")
+    return response
+
+
+@server.route('/export')
+def export_data():
+    """
+    Streams the merged data of ?sites=A,B (all by default) from ?start= to ?end= (YYYY-MM-DD) as
+    ?format=csv (default), parquet or arrow, day by day
+    """
+    try:
+        sites, start_date, end_date, fmt = export.parse_args(flask.request.args, get_sites())
+    except ValueError as e:
+        return flask.Response(f"{e}\n", status=400, mimetype='text/plain')
+    file_name = f"solar_{start_date.isoformat()}_{end_date.isoformat()}.{fmt}"
+    return flask.Response(export.stream_export(sites, start_date, end_date, fmt),
+                          mimetype=export.MIMETYPES[fmt],
+                          headers={'Content-Disposition': f'attachment; filename="{file_name}"'})
+
+
+@server.route('/events')
+def data_events():
+    """
+    Server-sent events of the data changes, assets/events.js clicks 'data-changed-trigger' on each of them
+    """
+    last_id = watcher.parse_event_id(flask.request.headers.get('Last-Event-ID'))
+    return flask.Response(watcher.stream_events(last_id=last_id),
+                          mimetype='text/event-stream',
+                          headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 def serve_layout():
+    options = funcs.get_dashboard_options(config.options_snapshot_path)
+    site_options = [dict(label=t, value=t) for t in options['sites']]
+    min_date, max_date = options['min_date'], options['max_date']
+    # Nearest date with actuals to today, today itself once its file is there
+    default_date = datetime.date.fromisoformat(options.get('default_date', max_date))
     return html.Div(
         children=[
             html.Div(
@@ -47,17 +148,46 @@ def serve_layout():
                             html.H2("Solar Forecast"),
                             html.P("""Select different Day & Site using the Date and Site picker."""),
                             html.Div(className="div-for-dropdown",
+                                     children=[
+                                         dcc.RadioItems(id="view-mode",
+                                                        options=[dict(label='Day', value='day'),
+                                                                 dict(label='Date Range', value='range'),
+                                                                 dict(label='Fleet', value='fleet')],
+                                                        value='day',
+                                                        persistence=True,
+                                                        persistence_type='local',
+                                                        labelStyle={'display': 'inline-block',
+                                                                    'padding-right': '12px'},
+                                                        inputStyle={"margin-right": "5px"})
+                                     ]),
+                            html.Div(id="single-date-div",
+                                     className="div-for-dropdown",
                                      children=[
                                          dcc.DatePickerSingle(id="date-picker",
                                                               min_date_allowed=min_date,
                                                               max_date_allowed=max_date,
-                                                              initial_visible_month=funcs.get_today_date(),
-                                                              date=funcs.get_today_date(),
+                                                              initial_visible_month=default_date,
+                                                              date=default_date,
                                                               display_format="MMMM D, YYYY",
                                                               persistence=True,
                                                               persistence_type='local',
                                                               style={"border": "0px solid black"})
                                      ]),
+                            html.Div(id="range-date-div",
+                                     className="div-for-dropdown",
+                                     style={'display': 'none'},
+                                     children=[
+                                         dcc.DatePickerRange(id="date-range-picker",
+                                                             min_date_allowed=min_date,
+                                                             max_date_allowed=max_date,
+                                                             initial_visible_month=default_date,
+                                                             start_date=default_date - datetime.timedelta(days=6),
+                                                             end_date=default_date,
+                                                             display_format="MMM D, YYYY",
+                                                             persistence=True,
+                                                             persistence_type='local',
+                                                             style={"border": "0px solid black"})
+                                     ]),
                             html.Div(className="row",
                                      children=[
                                          html.Div(className="div-for-dropdown",
@@ -78,7 +208,7 @@ def serve_layout():
                                           dcc.Checklist(
                                               id="output-selector",
                                               options=output_lines,
-                                              value=['Actual', 'Day Ahead Ensemble', 'IntraDay'],
+                                              value=default_outputs,
                                               persistence=True,
                                               persistence_type='local',
                                               # labelStyle={'display': 'inline-block'},
@@ -103,40 +233,163 @@ def serve_layout():
                     html.Div(
                         className="eight columns div-for-charts bg-grey",
                         children=[
+                            # Fallback refresh, the graphs are refreshed on the data change events
                             dcc.Interval(id='interval-component',
                                          interval=60 * config.REFRESH_RATE * 1000,  # in milliseconds i.e. 1*1000=1 sec
                                          n_intervals=0),
-                            html.Div(className="graph-headers", children=["Actual Power vs Forecast"],
-                                     style={'textAlign': 'center'}),
-                            dcc.Graph(id="solar-graph"),
-                            html.Div(className="graph-headers", children=["Error %"], style={'textAlign': 'center'}),
-                            dcc.Graph(id="error_graph")
+                            html.Button(id='data-changed-trigger', n_clicks=0, style={'display': 'none'}),
+                            # (view, data version) currently shown by each graph of this client
+                            dcc.Store(id='solar-graph-state'),
+                            dcc.Store(id='error-graph-state'),
+                            html.Div(id="site-graphs-div",
+                                     children=[
+                                         html.Div(className="graph-headers", children=["Actual Power vs Forecast"],
+                                                  style={'textAlign': 'center'}),
+                                         dcc.Graph(id="solar-graph"),
+                                         html.Div(className="graph-headers", children=["Error %"],
+                                                  style={'textAlign': 'center'}),
+                                         dcc.Graph(id="error_graph")
+                                     ]),
+                            html.Div(id="fleet-div",
+                                     style={'display': 'none'},
+                                     children=[
+                                         html.Div(className="graph-headers", children=["Fleet Error Ranking"],
+                                                  style={'textAlign': 'center'}),
+                                         dash_table.DataTable(id="fleet-table",
+                                                              sort_action='native',
+                                                              page_size=15,
+                                                              style_header={'backgroundColor': app_colors['axis'],
+                                                                            'fontWeight': 'bold'},
+                                                              style_cell={'backgroundColor': app_colors['background'],
+                                                                          'color': app_colors['text'],
+                                                                          'font-family': 'Open Sans',
+                                                                          'border': f"1px solid {app_colors['grid']}"}),
+                                         html.Div(className="graph-headers", children=["Error % by Site and Time"],
+                                                  style={'textAlign': 'center'}),
+                                         dcc.Graph(id="fleet-heatmap")
+                                     ])
                         ])
                 ])
         ])
 
 
-# Callback 1
-@app.callback(Output('solar-graph', 'figure'),
-              [Input('site-dropdown', 'value'),
-               Input('date-picker', 'date'),
-               Input('interval-component', 'n_intervals'),
-               Input('output-selector', 'value')])
-def update_graph(site, date, n, outputs):
-    if site is None:
-        site = 'NR_Solar'
-    if len(outputs) == 0:
-        outputs = ['Actual']
-
-    date = datetime.datetime.strptime(date, '%Y-%m-%d').strftime('%d-%m-%Y')
-    data = funcs.read_all_data_for_date_site(real_path=config.real_path,
-                                             log_path=config.logs_path,
-                                             intra_day_path=config.intra_day_path,
-                                             satellite_forecast_path=config.satellite_forecast_path,
-                                             day_ahead_ensemble_path=config.day_ahead_ensemble_path,
-                                             date=date,
-                                             site=site)
-    # Filter accord to output-selector
+def is_range_view(mode, start_date, end_date):
+    return mode == 'range' and start_date is not None and end_date is not None
+
+
+def get_range_dates(start_date, end_date):
+    """
+    Dates of the date range view, the span is capped at config.MAX_RANGE_DAYS
+    :param start_date: str '%Y-%m-%d' from the DatePickerRange
+    :param end_date: str '%Y-%m-%d' from the DatePickerRange
+    :return: tuple(datetime.date, datetime.date)
+    """
+    start_date = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
+    end_date = datetime.datetime.strptime(end_date, '%Y-%m-%d').date()
+    start_date = max(start_date, end_date - datetime.timedelta(days=config.MAX_RANGE_DAYS - 1))
+    return start_date, end_date
+
+
+def get_range_data(site, start_date, end_date, version):
+    """
+    read_date_range kept in the render cache, both graphs and the zoomed views of a range share one read
+    """
+    def build():
+        data, mape = read_date_range(site=site, start_date=start_date, end_date=end_date)
+        return dict(data=data, mape=mape)
+
+    entry = get_or_build(repr(['range-data', site, start_date, end_date]), version, build)
+    return entry['data'], entry['mape']
+
+
+def read_date_range(site, start_date, end_date):
+    """
+    Range data of a site for the date range view
+    :return: tuple(15 min values, daily MAPE) see funcs.aggregate_date_range
+    """
+    start_date, end_date = get_range_dates(start_date, end_date)
+    return funcs.aggregate_date_range(real_path=config.real_path,
+                                      intra_day_path=config.intra_day_path,
+                                      satellite_forecast_path=config.satellite_forecast_path,
+                                      day_ahead_ensemble_path=config.day_ahead_ensemble_path,
+                                      start_date=start_date,
+                                      end_date=end_date,
+                                      site=site)
+
+
+def get_data_version(day_view, date, start_date, end_date):
+    """
+    Version of the source files behind a view, changes as soon as one of them is added, removed or modified
+    :return: str
+    """
+    paths = funcs.get_source_paths()
+    if day_view:
+        dates = [datetime.datetime.strptime(date, '%Y-%m-%d').strftime('%d-%m-%Y')]
+    else:
+        # The range view has no Logs, a new log workbook does not change it. A day gaining its first file
+        # changes the list of dates, the days without any file are not looked up.
+        paths = paths[:4]
+        dates = funcs.get_dates_with_files(paths, *get_range_dates(start_date, end_date))
+    versions = [(one_date, funcs.get_date_version(paths=paths, date=one_date)) for one_date in dates]
+    return hashlib.sha1(repr(versions).encode()).hexdigest()
+
+
+def get_cached_figure(key, version):
+    with _figure_cache_lock:
+        entry = _figure_cache.get((key, version))
+        if entry is not None:
+            _figure_cache.move_to_end((key, version))
+    instrumentation.count_cache('figure', hit=entry is not None)
+    return entry
+
+
+def put_cached_figure(key, version, entry):
+    with _figure_cache_lock:
+        _figure_cache[(key, version)] = entry
+        while len(_figure_cache) > config.FIGURE_CACHE_SIZE:
+            _figure_cache.popitem(last=False)
+    return entry
+
+
+def get_or_build(key, version, build):
+    """
+    Cached entry of a view, built once for all the callbacks asking for it at the same time (interval ticks
+    of the screens showing the same view line up)
+    :param build: function without arguments returning the entry
+    :return: dict entry
+    """
+    entry = get_cached_figure(key, version)
+    if entry is not None:
+        return entry
+
+    def build_and_put():
+        # A callback that was waiting on a previous flight of the same key may find it cached already
+        with _figure_cache_lock:
+            cached = _figure_cache.get((key, version))
+        return cached if cached is not None else put_cached_figure(key, version, build())
+
+    return funcs.single_flight(('view', key, version), build_and_put)
+
+
+@app.callback([Output('single-date-div', 'style'),
+               Output('range-date-div', 'style'),
+               Output('site-graphs-div', 'style'),
+               Output('fleet-div', 'style')],
+              Input('view-mode', 'value'))
+def toggle_date_pickers(mode):
+    hidden = {'display': 'none'}
+    if mode == 'range':
+        return hidden, {}, {}, hidden
+    if mode == 'fleet':
+        return {}, hidden, hidden, {}
+    return {}, hidden, {}, hidden
+
+
+def select_outputs(data, outputs):
+    """
+    Filters the columns of the data according to the output-selector, 'Logs' stands for the log columns
+    :return: tuple(data with sorted columns, dict of column: color code)
+    """
     if 'Logs' in outputs:
         for col in data.columns:
             if ':' in col:
@@ -156,26 +409,20 @@ def update_graph(site, date, n, outputs):
                    'Satellite': 'yellow',
                    log_col1: 'darkgray',
                    log_col2: 'lightgray'}
+    return data, color_codes
+
 
+def get_line_colors(columns, color_codes):
     color_dict = {'green': 'rgb(153, 201, 69)',
                   'blue': 'rgb(102, 197, 204)',
                   'orange': 'rgb(248, 156, 116)',
                   'yellow': 'rgb(246, 207, 113)',
                   'darkgray': 'rgb(102, 102, 102)',
                   'lightgray': 'rgb(204, 204, 204)'}
+    return [color_dict.get(color_codes.get(col)) for col in columns]
 
-    col_seq = [color_dict.get(color_codes.get(col)) for col in data.columns]
-
-    fig = px.line(data_frame=data,
-                  y=data.columns,
-                  x=data.index,
-                  template='gridon',
-                  hover_name=data.index,
-                  color_discrete_sequence=col_seq,
-                  # color_discrete_sequence=px.colors.qualitative.Safe,
-                  # color_discrete_sequence=px.colors.qualitative.Pastel,
-                  height=config.G1_HEIGHT)
 
+def style_solar_figure(fig, day_view):
     # X Axis
     fig.update_xaxes(tickfont=dict(color=app_colors['text'], size=config.AXIS_TICK_SIZE),
                      showgrid=True,
@@ -206,44 +453,242 @@ def update_graph(site, date, n, outputs):
                         font_size=config.HOVER_SIZE),
         plot_bgcolor=app_colors['background'],
         paper_bgcolor=app_colors['background'],
-        xaxis_tickformat='%H:%M',
+        xaxis_tickformat='%H:%M' if day_view else '%d %b %H:%M',
         yaxis_tickformat=',')
 
     fig.update_layout(hovermode="x unified")
+    return fig
+
+
+def solar_figure(data, color_codes, day_view):
+    """
+    Line chart of Actual vs the forecasts for a day. The traces stop at their last value on a fixed
+    full day axis so the points arriving later can be appended with extendData.
+    """
+    fig = px.line(data_frame=data,
+                  y=data.columns,
+                  x=data.index,
+                  template='gridon',
+                  hover_name=data.index,
+                  color_discrete_sequence=get_line_colors(data.columns, color_codes),
+                  # color_discrete_sequence=px.colors.qualitative.Safe,
+                  # color_discrete_sequence=px.colors.qualitative.Pastel,
+                  height=config.G1_HEIGHT)
+    style_solar_figure(fig, day_view)
     fig.update_traces(mode="markers+lines", hovertemplate=None)
 
+    if day_view:
+        for trace, col in zip(fig.data, data.columns):
+            last = funcs.last_valid_slot(data[col].to_numpy())
+            trace.x, trace.y = trace.x[:last], trace.y[:last]
+        fig.update_xaxes(type='category', categoryorder='array', categoryarray=list(data.index),
+                         range=[-0.5, len(data.index) - 0.5])
+
     return fig
 
 
-# Callback 2
-@app.callback(Output('error_graph', 'figure'),
+def solar_range_figure(data, color_codes, zoom, uirevision):
+    """
+    Line chart of a date range (or of the zoomed window of it). Every trace is downsampled to
+    config.PLOT_WIDTH_PX min/max buckets and drawn with WebGL above config.WEBGL_THRESHOLD points.
+    :param zoom: list [start, end] of the x axis window or None for the whole range
+    :param uirevision: kept across refreshes of the same view so the legend and zoom state survive
+    """
+    if zoom is not None:
+        data = data.loc[zoom[0]:zoom[1]]
+    webgl = data.count().sum() > config.WEBGL_THRESHOLD
+    trace_type = go.Scattergl if webgl else go.Scatter
+
+    fig = go.Figure(layout=dict(template='gridon', height=config.G1_HEIGHT))
+    for col, color in zip(data.columns, get_line_colors(data.columns, color_codes)):
+        values = data[col].to_numpy()
+        keep = funcs.downsample_min_max(values, 2 * config.PLOT_WIDTH_PX)
+        fig.add_trace(trace_type(x=data.index[keep], y=values[keep], name=col,
+                                 mode='lines' if webgl else 'markers+lines',
+                                 line=dict(color=color), marker=dict(color=color)))
+    style_solar_figure(fig, day_view=False)
+    fig.update_layout(uirevision=uirevision)
+    if zoom is not None:
+        fig.update_xaxes(range=zoom)
+    return fig
+
+
+def get_zoom_window(relayout_data, start_date, end_date):
+    """
+    x axis window the user zoomed to in the date range view, from the relayoutData of the graph
+    :return: list [start, end] or None when not zoomed or the window is outside of the range
+    """
+    if not relayout_data or 'xaxis.autorange' in relayout_data:
+        return None
+    if 'xaxis.range[0]' in relayout_data:
+        zoom = [relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']]
+    elif 'xaxis.range' in relayout_data:
+        zoom = list(relayout_data['xaxis.range'])
+    else:
+        return None
+    start_date, end_date = get_range_dates(start_date, end_date)
+    if zoom[1] < start_date.isoformat() or zoom[0] > (end_date + datetime.timedelta(days=1)).isoformat():
+        return None
+    return zoom
+
+
+def get_appended_points(old, new):
+    """
+    extendData of the points of the new data beyond the last value of every trace of the old data
+    :return: list [update, trace indices] or None when values other than appended points changed
+    """
+    if list(old.columns) != list(new.columns):
+        return None
+    old_values, new_values = old.to_numpy(), new.to_numpy()
+    update = dict(x=[], y=[])
+    for i in range(old_values.shape[1]):
+        old_last = funcs.last_valid_slot(old_values[:, i])
+        new_last = funcs.last_valid_slot(new_values[:, i])
+        if new_last < old_last or not np.array_equal(old_values[:old_last, i], new_values[:old_last, i],
+                                                     equal_nan=True):
+            return None
+        update['x'].append(list(new.index[old_last:new_last]))
+        update['y'].append([None if y != y else y for y in new_values[old_last:new_last, i]])
+    return [update, list(range(old_values.shape[1]))]
+
+
+# Callback 1
+@app.callback([Output('solar-graph', 'figure'),
+               Output('solar-graph', 'extendData'),
+               Output('solar-graph-state', 'data')],
               [Input('site-dropdown', 'value'),
                Input('date-picker', 'date'),
-               Input('interval-component', 'n_intervals')])
-def update_graph(site, date, n):
+               Input('interval-component', 'n_intervals'),
+               Input('data-changed-trigger', 'n_clicks'),
+               Input('output-selector', 'value'),
+               Input('view-mode', 'value'),
+               Input('date-range-picker', 'start_date'),
+               Input('date-range-picker', 'end_date'),
+               Input('solar-graph', 'relayoutData')],
+              State('solar-graph-state', 'data'))
+def update_graph(site, date, n, n_changes, outputs, mode, start_date, end_date, relayout_data, graph_state):
+    with instrumentation.timer('callback_seconds', callback='solar-graph'):
+        return solar_graph_update(site, date, outputs, mode, start_date, end_date, relayout_data, graph_state)
+
+
+def solar_graph_update(site, date, outputs, mode, start_date, end_date, relayout_data, graph_state):
+    if mode == 'fleet':
+        return no_update, no_update, no_update
     if site is None:
         site = 'NR_Solar'
-    date = datetime.datetime.strptime(date, '%Y-%m-%d').strftime('%d-%m-%Y')
-    data = funcs.read_all_data_for_date_site(real_path=config.real_path,
-                                             log_path=config.logs_path,
-                                             intra_day_path=config.intra_day_path,
-                                             satellite_forecast_path=config.satellite_forecast_path,
-                                             day_ahead_ensemble_path=config.day_ahead_ensemble_path,
-                                             date=date,
-                                             site=site)
-    show_cols = config.error_bars_for
-    if len(show_cols) > 1:
-        raise ValueError("The error graphs are only supported for maximum one output. "
-                          "Please check 'show_cols' in config")
-    else:
-        show_cols = show_cols[0]
+    if len(outputs) == 0:
+        outputs = ['Actual']
+    day_view = not is_range_view(mode, start_date, end_date)
+
+    view = ['solar', site, sorted(outputs)] + ([date] if day_view else [start_date, end_date])
+    uirevision = repr(view)
+    zoom = None if day_view else get_zoom_window(relayout_data, start_date, end_date)
+    if zoom is not None:
+        view.append(zoom)
+    key, version = repr(view), get_data_version(day_view, date, start_date, end_date)
+    new_state = dict(key=key, version=version)
+    if graph_state == new_state:
+        return no_update, no_update, no_update
+
+    def build():
+        if day_view:
+            data = funcs.get_data_for_date_site(real_path=config.real_path,
+                                                log_path=config.logs_path,
+                                                intra_day_path=config.intra_day_path,
+                                                satellite_forecast_path=config.satellite_forecast_path,
+                                                day_ahead_ensemble_path=config.day_ahead_ensemble_path,
+                                                date=datetime.datetime.strptime(date, '%Y-%m-%d').strftime('%d-%m-%Y'),
+                                                site=site)
+            columns = outputs
+        else:
+            data, _ = get_range_data(site=site, start_date=start_date, end_date=end_date, version=version)
+            columns = [col for col in outputs if col in data.columns] or ['Actual']
+        data, color_codes = select_outputs(data, columns)
+        return dict(data=data, color_codes=color_codes, figure=None)
+
+    entry = get_or_build(key, version, build)
+
+    # Only send the new 15 min points when the client shows the previous version of the same view
+    if day_view and graph_state is not None and graph_state.get('key') == key:
+        previous = get_cached_figure(key, graph_state.get('version'))
+        if previous is not None:
+            appended = get_appended_points(previous['data'], entry['data'])
+            if appended is not None:
+                return no_update, appended, new_state
+
+    if entry['figure'] is None:
+        funcs.single_flight(('figure', key, version), lambda: build_solar_figure(entry, day_view, zoom, uirevision))
+    return entry['figure'], no_update, new_state
+
+
+def build_solar_figure(entry, day_view, zoom, uirevision):
+    if entry['figure'] is not None:
+        return entry['figure']
+    with instrumentation.timer('stage_seconds', stage='solar_figure'):
+        if day_view:
+            entry['figure'] = solar_figure(entry['data'], entry['color_codes'], day_view)
+        else:
+            entry['figure'] = solar_range_figure(entry['data'], entry['color_codes'], zoom, uirevision)
+    return entry['figure']
+
+
+def daily_mape_figure(mape, show_col):
+    """
+    Bar chart of the daily MAPE of a forecast for the date range view
+    :param mape: pd.DataFrame of daily MAPE, see funcs.aggregate_date_range
+    :param show_col: The forecast column
+    """
+    clrred = 'rgb(251, 128, 114)'
+    clrgrn = 'rgb(153, 201, 69)'
+    data = mape[[show_col]]
+    colorlimit = [clrred if x >= 0.15 else clrgrn for x in data[show_col]]
 
-    # CALC ERROR
-    data = data[['Actual', show_cols]]
+    fig = px.bar(data_frame=data,
+                 y=show_col,
+                 x=data.index,
+                 template='gridon',
+                 height=config.G2_HEIGHT)
+    range_mape = data[show_col].mean(skipna=True)
+    if range_mape == range_mape:
+        fig.add_hline(y=range_mape, line_width=1, line_dash="dash", line_color="darkorange", opacity=0.7,
+                      annotation_text=f"MAPE: {round(range_mape * 100, 1)}%",
+                      annotation_position="top right", annotation=dict(font_size=14, font_family='Open Sans'))
+    fig.update_traces(marker_color=colorlimit, hovertemplate='<br> Date = %{x} <br>MAPE = %{y}')
+    fig.update_xaxes(tickfont=dict(color=app_colors['text'], size=config.AXIS_TICK_SIZE),
+                     linecolor=app_colors['axis'])
+    fig.update_yaxes(tickangle=0, tickfont=dict(color=app_colors['text'], size=config.AXIS_TICK_SIZE),
+                     tickformat=".0%",
+                     linecolor=app_colors['axis'])
+    fig.update_layout(
+        showlegend=False,
+        xaxis_title=None,
+        yaxis_title="Daily MAPE",
+        font=dict(size=config.GEN_FONT_GRAPHS,
+                  color=app_colors['text']),
+        hoverlabel=dict(bgcolor=app_colors['background'],
+                        font_size=config.HOVER_SIZE),
+        plot_bgcolor=app_colors['background'],
+        paper_bgcolor=app_colors['background'],
+        xaxis_tickformat='%d %b')
+    return fig
 
-    data[show_cols] = (abs(data[show_cols] - data['Actual']) / data['Actual'])
-    data.replace([inf, -inf], nan, inplace=True)
-    data.drop('Actual', axis=1, inplace=True)
+
+def error_figure(site, date, start_date, end_date, day_view, version=None):
+    """
+    Error bars of the day or daily MAPE bars of the date range
+    :param version: get_data_version of the view when already known
+    """
+    if not day_view:
+        if version is None:
+            version = get_data_version(day_view, date, start_date, end_date)
+        _, mape = get_range_data(site=site, start_date=start_date, end_date=end_date, version=version)
+        show_cols = [col for col in config.error_bars_for if col in mape.columns] or ['IntraDay']
+        return daily_mape_figure(mape=mape, show_col=show_cols[0])
+
+    date = datetime.datetime.strptime(date, '%Y-%m-%d').strftime('%d-%m-%Y')
+    day_metrics = metrics.get_day_metrics(date=date, site=site)
+    show_cols = metrics.get_error_columns(day_metrics, config.error_bars_for) or ['IntraDay']
+    data = day_metrics.ape[show_cols]
 
     color_dict = {'green': 'rgb(153, 201, 69)',
                   'blue': 'rgb(102, 197, 204)',
@@ -255,26 +700,36 @@ def update_graph(site, date, n):
 
     clrred = color_dict.get('red')  # 'rgb(204,102,119)'
     clrgrn = color_dict.get('green')
-    colorlimit = data[data.columns[0]].apply(lambda x: clrred if x >= 0.15 else clrgrn)
-    data.fillna(0, inplace=True)
+    color_codes = {'IntraDay': 'orange',
+                   'Day Ahead Ensemble': 'blue',
+                   'Satellite': 'yellow'}
+    col_seq = [color_dict.get(color_codes.get(col, 'lightgray')) for col in show_cols]
+    colorlimit = data[show_cols[0]].apply(lambda x: clrred if x >= 0.15 else clrgrn)
+    data = data.fillna(0)
 
     # PLOT
     fig = px.bar(data_frame=data,
                  y=show_cols,
                  x=data.index,
                  template='gridon',
-                 color_discrete_sequence=[clrgrn, clrred],
+                 barmode='group',
+                 color_discrete_sequence=col_seq,
                  hover_name=data.index,
                  height=config.G2_HEIGHT)
 
-    intra_day_mape = data[data.columns[0]].mean(skipna=True)
-
     # MAPE LINES
-    fig.add_hline(y=intra_day_mape, line_width=1, line_dash="dash", line_color="darkorange", opacity=0.7,
-                  annotation_text=f"MAPE: {round(intra_day_mape * 100, 1)}%",
-                  annotation_position="top right", annotation=dict(font_size=14, font_family='Open Sans'))
-    fig.update_layout(showlegend=False)
-    fig.update_traces(marker_color=colorlimit)
+    for col, col_color in zip(show_cols, col_seq):
+        col_mape = day_metrics.mape[col]
+        if col_mape != col_mape:
+            continue
+        label = "MAPE" if len(show_cols) == 1 else f"{col} MAPE"
+        fig.add_hline(y=col_mape, line_width=1, line_dash="dash", opacity=0.7,
+                      line_color="darkorange" if len(show_cols) == 1 else col_color,
+                      annotation_text=f"{label}: {round(col_mape * 100, 1)}%",
+                      annotation_position="top right", annotation=dict(font_size=14, font_family='Open Sans'))
+    if len(show_cols) == 1:
+        fig.update_layout(showlegend=False)
+        fig.update_traces(marker_color=colorlimit)
 
     # TOOLTIP
     fig.update_traces(hovertemplate='<br> Time = %{x} <br>Error = %{y}')
@@ -313,6 +768,104 @@ def update_graph(site, date, n):
     return fig
 
 
+# Callback 2
+@app.callback([Output('error_graph', 'figure'),
+               Output('error-graph-state', 'data')],
+              [Input('site-dropdown', 'value'),
+               Input('date-picker', 'date'),
+               Input('interval-component', 'n_intervals'),
+               Input('data-changed-trigger', 'n_clicks'),
+               Input('view-mode', 'value'),
+               Input('date-range-picker', 'start_date'),
+               Input('date-range-picker', 'end_date')],
+              State('error-graph-state', 'data'))
+def update_graph(site, date, n, n_changes, mode, start_date, end_date, graph_state):
+    with instrumentation.timer('callback_seconds', callback='error-graph'):
+        return error_graph_update(site, date, mode, start_date, end_date, graph_state)
+
+
+def error_graph_update(site, date, mode, start_date, end_date, graph_state):
+    if mode == 'fleet':
+        return no_update, no_update
+    if site is None:
+        site = 'NR_Solar'
+    day_view = not is_range_view(mode, start_date, end_date)
+
+    view = ['error', site, config.error_bars_for] + ([date] if day_view else [start_date, end_date])
+    key, version = repr(view), get_data_version(day_view, date, start_date, end_date)
+    new_state = dict(key=key, version=version)
+    if graph_state == new_state:
+        return no_update, no_update
+
+    def build():
+        with instrumentation.timer('stage_seconds', stage='error_figure'):
+            return dict(figure=error_figure(site, date, start_date, end_date, day_view, version))
+
+    entry = get_or_build(key, version, build)
+    return entry['figure'], new_state
+
+
+def fleet_view(date):
+    """
+    Ranked table and site x time error heatmap of all the sites for a day, worst MAPE first
+    :param date: str '%d-%m-%Y'
+    :return: dict(data, columns, figure)
+    """
+    fleet_metrics = metrics.get_fleet_metrics(date)
+    show_col = ([col for col in config.error_bars_for if col in fleet_metrics.ape] or ['IntraDay'])[0]
+    table = fleet_metrics.table.sort_values(f"{show_col} MAPE", ascending=False)
+    mape_cols = [col for col in table.columns if col.endswith('MAPE')]
+    table[mape_cols] = table[mape_cols] * 100
+    table = table.round(1).reset_index()
+    columns = [dict(name=f"{col} %" if col in mape_cols else col, id=col) for col in table.columns]
+
+    ape = fleet_metrics.ape[show_col].reindex(table['Site'])
+    figure = go.Figure(go.Heatmap(z=ape.to_numpy(),
+                                  x=list(ape.columns),
+                                  y=list(ape.index),
+                                  zmin=0,
+                                  zmax=0.5,
+                                  colorscale=[[0, 'rgb(153, 201, 69)'], [0.3, 'rgb(246, 207, 113)'],
+                                              [1, 'rgb(251, 128, 114)']],
+                                  colorbar=dict(tickformat=".0%"),
+                                  hovertemplate='Site = %{y}<br>Time = %{x}<br>Error = %{z:.1%}<extra></extra>'))
+    figure.update_yaxes(autorange='reversed', tickfont=dict(color=app_colors['text'], size=config.AXIS_TICK_SIZE))
+    figure.update_xaxes(tickfont=dict(color=app_colors['text'], size=config.AXIS_TICK_SIZE),
+                        tickvals=list(ape.columns[::8]))
+    figure.update_layout(title_text=f"{show_col} absolute percentage error",
+                         title_x=0.5,
+                         height=max(config.G2_HEIGHT, 20 * len(ape.index) + 100),
+                         font=dict(size=config.GEN_FONT_GRAPHS,
+                                   color=app_colors['text']),
+                         plot_bgcolor=app_colors['background'],
+                         paper_bgcolor=app_colors['background'])
+    return dict(data=table.to_dict('records'), columns=columns, figure=figure)
+
+
+@app.callback([Output('fleet-table', 'data'),
+               Output('fleet-table', 'columns'),
+               Output('fleet-heatmap', 'figure')],
+              [Input('date-picker', 'date'),
+               Input('view-mode', 'value'),
+               Input('interval-component', 'n_intervals'),
+               Input('data-changed-trigger', 'n_clicks')])
+def update_fleet(date, mode, n, n_changes):
+    return fleet_update(date, mode)
+
+
+def fleet_update(date, mode):
+    if mode != 'fleet':
+        return no_update, no_update, no_update
+    key, version = repr(['fleet', date, config.error_bars_for]), get_data_version(True, date, None, None)
+
+    def build():
+        with instrumentation.timer('callback_seconds', callback='fleet'):
+            return fleet_view(datetime.datetime.strptime(date, '%Y-%m-%d').strftime('%d-%m-%Y'))
+
+    entry = get_or_build(key, version, build)
+    return entry['data'], entry['columns'], entry['figure']
+
+
 @app.callback(Output('showing-site', 'children'),
               Input('site-dropdown', 'value'))
 def display_site_selected(site):
@@ -328,12 +881,38 @@ def display_site_selected(date):
     return f"Date : {date}"
 
 
-@app.callback(Output('updated-at', 'children'), [Input('interval-component', 'n_intervals')])
-def update_dashboard_for_today(n):
+@app.callback(Output('updated-at', 'children'), [Input('interval-component', 'n_intervals'),
+                                                  Input('data-changed-trigger', 'n_clicks')])
+def update_dashboard_for_today(n, n_changes):
     return [f'Dashboard updated at : {funcs.get_current_time()}']
 
 
+def warm_views(date, sites):
+    """
+    Builds the cached day views of a date with the default outputs: the solar and error graphs of every site
+    and the fleet view, see prewarm.py
+    :param date: str '%d-%m-%Y'
+    :param sites: list of sites
+    """
+    date = datetime.datetime.strptime(date, '%d-%m-%Y').date().isoformat()
+    # A site failing (e.g. a missing column or log sheet) must not stop the warming of the others
+    for site in sites:
+        try:
+            solar_graph_update(site, date, list(default_outputs), 'day', None, None, None, None)
+            error_graph_update(site, date, 'day', None, None, None)
+        except Exception:
+            server.logger.exception(f"Pre-warming {site} for {date} failed")
+    try:
+        fleet_update(date, 'fleet')
+    except Exception:
+        server.logger.exception(f"Pre-warming the fleet view for {date} failed")
+
+
 app.layout = serve_layout
 
+# After the callbacks it runs are defined
+if run_background_tasks:
+    prewarm.start_prewarm(get_sites=get_sites, warm_views=warm_views)
+
 if __name__ == '__main__':
     app.run_server(debug=True, host=config.HOST, port=config.PORT)
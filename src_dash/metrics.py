@@ -0,0 +1,231 @@
+"""
+Error metrics of the forecasts against Actual, per site and per day.
+Results are kept in a process-wide store keyed on (date, site), shared with the other workers through
+shared_cache, and are only recomputed when one of the source files of the day changed. A background thread
+keeps the recent days of every site up to date so the error graph never computes them on a refresh.
+"""
+import time
+import logging
+import datetime
+import threading
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import config
+import funcs
+import shared_cache
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# ape: pd.DataFrame 96 x forecasts, mape / rmse: pd.Series indexed on the forecasts
+DayMetrics = namedtuple('DayMetrics', ['ape', 'mape', 'rmse'])
+
+# table: pd.DataFrame site x (MAPE, RMSE of every forecast), ape: dict of forecast: pd.DataFrame site x 96 slots
+FleetMetrics = namedtuple('FleetMetrics', ['table', 'ape'])
+
+# {(date, site): (version, DayMetrics)} and {date: (version, FleetMetrics)}
+_metrics_store = {}
+_fleet_store = {}
+_metrics_lock = threading.Lock()
+_engine_thread = None
+
+
+def get_paths():
+    return dict(real_path=config.real_path,
+                intra_day_path=config.intra_day_path,
+                day_ahead_ensemble_path=config.day_ahead_ensemble_path,
+                satellite_forecast_path=config.satellite_forecast_path,
+                log_path=config.logs_path)
+
+
+def get_csv_paths():
+    paths = get_paths()
+    paths.pop('log_path')
+    return paths
+
+
+def get_day_version(date):
+    """
+    Version of a day, changes as soon as any of its source files is added, removed or modified
+    :param date: str '%d-%m-%Y'
+    :return: tuple
+    """
+    return funcs.get_date_version(paths=get_paths().values(), date=date)
+
+
+def compute_day_metrics(data):
+    """
+    Vectorized APE / MAPE / RMSE of every forecast column of a day frame against Actual
+    :param data: pd.DataFrame from funcs.get_data_for_date_site
+    :return: DayMetrics
+    """
+    forecasts = [col for col in data.columns if col != 'Actual']
+    values = data[forecasts].to_numpy()
+    actual = data[['Actual']].to_numpy()
+
+    ape = funcs.absolute_percentage_error(values, actual)
+    mape = funcs.nan_mean(ape, axis=0)
+    rmse = np.sqrt(funcs.nan_mean((values - actual) ** 2, axis=0))
+    return DayMetrics(ape=pd.DataFrame(ape, index=data.index, columns=forecasts),
+                      mape=pd.Series(mape, index=forecasts),
+                      rmse=pd.Series(rmse, index=forecasts))
+
+
+def read_site_day(fleet_days, date, site):
+    """
+    Day frame of a site from the csv sources of the date read once for all the sites, by the first site asking
+    :param fleet_days: dict of date: funcs.read_fleet_for_date result, filled as the dates are read
+    :return: pd.DataFrame
+    """
+    if date not in fleet_days:
+        fleet_days[date] = funcs.read_fleet_for_date(date=date, **get_csv_paths())
+    sites, blocks = fleet_days[date]
+    return funcs.assemble_site_from_fleet(sites, blocks, log_path=config.logs_path, date=date, site=site)
+
+
+def get_day_metrics(date, site, version=None, fleet_days=None):
+    """
+    Metrics of a site for a day from the store, computed only if missing or one of the source files changed
+    :param date: str '%d-%m-%Y'
+    :param site: The site
+    :param version: optional, the get_day_version of the date when already known
+    :param fleet_days: optional, computes from the fleet reads of read_site_day instead of the frame cache
+    :return: DayMetrics
+    """
+    if version is None:
+        version = get_day_version(date)
+    with _metrics_lock:
+        entry = _metrics_store.get((date, site))
+    if entry is not None and entry[0] == version:
+        instrumentation.count_cache('metrics', hit=True)
+        return entry[1]
+    instrumentation.count_cache('metrics', hit=False)
+
+    day_metrics = shared_cache.get('metrics', (date, site), version)
+    if day_metrics is None:
+        if fleet_days is not None:
+            data = read_site_day(fleet_days, date, site)
+        else:
+            # Through the frame cache, the solar graph of the same day has usually read it already
+            data = funcs.get_data_for_date_site(date=date, site=site, **get_paths())
+        day_metrics = compute_day_metrics(data)
+        shared_cache.put('metrics', (date, site), version, day_metrics)
+    with _metrics_lock:
+        _metrics_store[(date, site)] = (version, day_metrics)
+    return day_metrics
+
+
+def compute_fleet_metrics(sites, blocks):
+    """
+    APE / MAPE / RMSE of every forecast for all the sites at once
+    :param sites: list of sites
+    :param blocks: dict of source: np.ndarray (96, len(sites)) from funcs.read_fleet_for_date
+    :return: FleetMetrics
+    """
+    actual = blocks['Actual']
+    table = pd.DataFrame(index=pd.Index(sites, name='Site'))
+    ape_frames = {}
+    for name in [name for name in blocks if name != 'Actual']:
+        ape = funcs.absolute_percentage_error(blocks[name], actual)
+        table[f"{name} MAPE"] = funcs.nan_mean(ape, axis=0)
+        table[f"{name} RMSE"] = np.sqrt(funcs.nan_mean((blocks[name] - actual) ** 2, axis=0))
+        ape_frames[name] = pd.DataFrame(ape.T, index=sites, columns=funcs.TIME_INDEX)
+    return FleetMetrics(table=table, ape=ape_frames)
+
+
+def get_fleet_metrics(date):
+    """
+    Metrics of all the sites for a day, computed only if missing or one of the source files changed
+    :param date: str '%d-%m-%Y'
+    :return: FleetMetrics
+    """
+    version = get_day_version(date)
+    with _metrics_lock:
+        entry = _fleet_store.get(date)
+    if entry is not None and entry[0] == version:
+        instrumentation.count_cache('fleet_metrics', hit=True)
+        return entry[1]
+    instrumentation.count_cache('fleet_metrics', hit=False)
+
+    fleet_metrics = shared_cache.get('fleet', date, version)
+    if fleet_metrics is None:
+        sites, blocks = funcs.read_fleet_for_date(date=date, **get_csv_paths())
+        fleet_metrics = compute_fleet_metrics(sites, blocks)
+        shared_cache.put('fleet', date, version, fleet_metrics)
+    with _metrics_lock:
+        _fleet_store[date] = (version, fleet_metrics)
+        while len(_fleet_store) > config.METRICS_DAYS:
+            del _fleet_store[next(iter(_fleet_store))]
+    return fleet_metrics
+
+
+def get_error_columns(day_metrics, outputs):
+    """
+    APE columns to show for the outputs configured in config.error_bars_for, 'Logs' stands for the log columns
+    """
+    columns = []
+    for output in outputs:
+        if output == 'Logs':
+            columns.extend(col for col in day_metrics.ape.columns if ':' in col)
+        elif output in day_metrics.ape.columns:
+            columns.append(output)
+    return columns
+
+
+def refresh(dates, sites):
+    """
+    Brings the metrics of the dates x sites up to date, days whose files did not change are skipped. The csv
+    sources of a date are read once for all the sites and the frame cache of the callbacks is left alone.
+    :return: int, number of (date, site) recomputed
+    """
+    recomputed = 0
+    for date in dates:
+        version = get_day_version(date)
+        fleet_days = {}
+        for site in sites:
+            with _metrics_lock:
+                entry = _metrics_store.get((date, site))
+            if entry is not None and entry[0] == version:
+                continue
+            try:
+                get_day_metrics(date=date, site=site, version=version, fleet_days=fleet_days)
+                recomputed += 1
+            except (KeyError, ValueError) as e:
+                logger.debug(f"No metrics for {date} {site}: {e}")
+
+    # Drop the days that left the refreshed window
+    with _metrics_lock:
+        for key in [key for key in _metrics_store if key[0] not in dates]:
+            del _metrics_store[key]
+    return recomputed
+
+
+def _run_engine(get_sites):
+    while True:
+        today = datetime.date.today()
+        dates = [(today - datetime.timedelta(days=day)).strftime('%d-%m-%Y')
+                 for day in range(config.METRICS_DAYS)]
+        start = time.perf_counter()
+        # Computed by one worker, the others read the results through shared_cache
+        if not shared_cache.is_leader():
+            time.sleep(config.METRICS_REFRESH_SECS)
+            continue
+        try:
+            recomputed = refresh(dates=dates, sites=get_sites())
+            logger.debug(f"Metrics refresh: {recomputed} recomputed in {time.perf_counter() - start:.2f}s")
+        except Exception:
+            logger.exception("Metrics refresh failed")
+        time.sleep(config.METRICS_REFRESH_SECS)
+
+
+def start_engine(get_sites):
+    """
+    Starts the background thread refreshing the last config.METRICS_DAYS days of every site
+    :param get_sites: callable returning the list of sites
+    """
+    global _engine_thread
+    if _engine_thread is None:
+        _engine_thread = threading.Thread(target=_run_engine, args=(get_sites,), name='metrics-engine', daemon=True)
+        _engine_thread.start()
+    return _engine_thread
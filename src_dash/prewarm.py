@@ -0,0 +1,87 @@
+"""
+Pre-computes the views of the upcoming dates (today and tomorrow by default) for every site as soon as
+their files land or change: the merged frames, the metrics and the figures end up in the caches before
+the first screen asks for them. The scheduler wakes up on the data change events of watcher.py, and at
+least every config.PREWARM_INTERVAL_SECS for the date rollover.
+
+Only the worker process elected by shared_cache.is_leader warms, the others pick up the data and metrics it
+computed through shared_cache and build their figures from them.
+"""
+import time
+import logging
+import datetime
+import threading
+import config
+import funcs
+import watcher
+import shared_cache
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# {date: source versions the views were last warmed for}
+_warmed = {}
+_prewarm_thread = None
+
+
+def get_prewarm_dates():
+    today = datetime.date.today()
+    return [(today + datetime.timedelta(days=day)).strftime('%d-%m-%Y') for day in config.PREWARM_DAYS]
+
+
+def warm_once(sites, warm_views):
+    """
+    Warms the dates with a new or changed source file since they were last warmed
+    :param sites: list of sites
+    :param warm_views: function(date, sites) computing the cached views of a date, date as '%d-%m-%Y'
+    :return: list of the dates warmed
+    """
+    warmed = []
+    if not sites:
+        # The sites are not discovered yet
+        return warmed
+    dates = get_prewarm_dates()
+    for date in dates:
+        version = funcs.get_date_version(paths=funcs.get_source_paths(), date=date)
+        # Nothing to warm before the first file of the date lands
+        if _warmed.get(date) == version or not any(version):
+            continue
+        start = time.perf_counter()
+        try:
+            warm_views(date, sites)
+        except Exception:
+            logger.exception(f"Pre-warming {date} failed")
+            continue
+        instrumentation.observe('prewarm_seconds', time.perf_counter() - start)
+        _warmed[date] = version
+        warmed.append(date)
+
+    for date in [date for date in _warmed if date not in dates]:
+        del _warmed[date]
+    return warmed
+
+
+def _run_prewarm(get_sites, warm_views):
+    last_id = 0
+    while True:
+        start = time.perf_counter()
+        warmed = warm_once(get_sites(), warm_views) if shared_cache.is_leader() else []
+        if warmed:
+            logger.debug(f"Pre-warmed {warmed} in {time.perf_counter() - start:.2f}s")
+        events = watcher.get_events_after(last_id, timeout=config.PREWARM_INTERVAL_SECS)
+        if events:
+            last_id = events[-1][0]
+
+
+def start_prewarm(get_sites, warm_views):
+    """
+    Starts the background thread keeping the views of config.PREWARM_DAYS warm
+    :param get_sites: callable returning the list of sites
+    :param warm_views: function(date, sites) computing the cached views of a date
+    """
+    global _prewarm_thread
+    if _prewarm_thread is None:
+        _prewarm_thread = threading.Thread(target=_run_prewarm, args=(get_sites, warm_views),
+                                           name='prewarm', daemon=True)
+        _prewarm_thread.start()
+    return _prewarm_thread
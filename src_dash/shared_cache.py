@@ -0,0 +1,136 @@
+"""
+Cache shared by all the worker processes of the app, kept as pickle files in a local folder.
+Every entry carries the version of the source files it was built from and is ignored once they changed,
+entries are also pruned after config.SHARED_CACHE_TTL. Disabled when config.shared_cache_path is None.
+"""
+import os
+import time
+import pickle
+import hashlib
+import logging
+import threading
+import config
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_last_prune = time.monotonic()
+_prune_lock = threading.Lock()
+# Open lock file of the elected leader process, held until the process exits
+_leader_file = None
+
+
+def is_enabled():
+    return config.shared_cache_path is not None
+
+
+def is_leader():
+    """
+    Elects the one worker process running the background computations (pre-warming, metrics engine) with an
+    exclusive lock on a file of config.shared_cache_path, taken over by another worker once the process holding
+    it exits. Every process is a leader when the shared cache is disabled (single process) or file locks are
+    not available.
+    :return: bool, True when this process holds the lock
+    """
+    global _leader_file
+    if _leader_file is not None or not is_enabled() or fcntl is None:
+        return True
+    lock_path = os.path.join(config.shared_cache_path, 'locks', 'leader.lock')
+    try:
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        lock_file = open(lock_path, 'a')
+    except OSError as e:
+        logger.warning(f"Unable to open the leader lock {lock_path}, {e}")
+        return False
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        # Held by another worker
+        lock_file.close()
+        return False
+    _leader_file = lock_file
+    logger.info(f"Background computations run in process {os.getpid()}")
+    return True
+
+
+def _entry_path(namespace, key):
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()
+    return os.path.join(config.shared_cache_path, namespace, f"{digest}.pkl")
+
+
+def get(namespace, key, version):
+    """
+    Value stored for the key if it was stored for the same version and is not expired
+    :param namespace: str, e.g. 'data' or 'metrics'
+    :param key: any value with a stable repr
+    :param version: the version the value must have been built from
+    :return: the value or None
+    """
+    if not is_enabled():
+        return None
+    path = _entry_path(namespace, key)
+    try:
+        if time.time() - os.stat(path).st_mtime > config.SHARED_CACHE_TTL:
+            return None
+        with open(path, 'rb') as f:
+            stored_version, value = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    return value if stored_version == version else None
+
+
+def put(namespace, key, version, value):
+    """
+    Stores the value for the key and version, through a temp file so other workers never read a partial entry
+    """
+    if not is_enabled():
+        return
+    path = _entry_path(namespace, key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((version, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Unable to write the shared cache entry {path}, {e}")
+    _maybe_prune()
+
+
+def prune():
+    """
+    Removes the expired entries, then the oldest ones above config.SHARED_CACHE_MAX_ENTRIES per namespace
+    :return: int, number of entries removed
+    """
+    removed = 0
+    now = time.time()
+    for namespace in os.listdir(config.shared_cache_path):
+        folder = os.path.join(config.shared_cache_path, namespace)
+        with os.scandir(folder) as entries:
+            files = [(entry.stat().st_mtime, entry.path) for entry in entries if entry.name.endswith('.pkl')]
+        files.sort()
+        expired = [path for mtime, path in files if now - mtime > config.SHARED_CACHE_TTL]
+        surplus = [path for mtime, path in files[:max(len(files) - config.SHARED_CACHE_MAX_ENTRIES, 0)]]
+        for path in set(expired + surplus):
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def _maybe_prune():
+    global _last_prune
+    with _prune_lock:
+        if time.monotonic() - _last_prune < config.SHARED_CACHE_PRUNE_SECS:
+            return
+        _last_prune = time.monotonic()
+    try:
+        prune()
+    except OSError as e:
+        logger.warning(f"Unable to prune the shared cache, {e}")
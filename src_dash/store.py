@@ -0,0 +1,217 @@
+"""
+Columnar store of the daily source files so a single site can be read without parsing the whole file.
+Every daily file is converted to one .npz (partitioned by date) holding one array per site column,
+np.load only decompresses the member that is asked for. The daily log workbooks are converted the first
+time they are read (or after they change) to the last two columns of every sheet.
+
+Run as a script to ingest the configured source folders:
+    python store.py [--days N]
+"""
+import os
+import argparse
+import datetime
+import threading
+import numpy as np
+import pandas as pd
+import config
+
+
+# One conversion at a time per converted file -> {store_file: threading.Lock}
+_ingest_locks = {}
+_ingest_locks_lock = threading.Lock()
+
+# read_log_sheet result of a converted workbook without a sheet for the site
+NO_SHEET = object()
+
+
+def get_store_folder(source_folder):
+    """
+    Folder of the store holding the converted files of a source folder
+    :param source_folder: The source folder e.g. config.real_path
+    :return: str
+    """
+    name = os.path.normpath(source_folder).strip(os.sep).replace(os.sep, '__')
+    return os.path.join(config.columnar_store_path, name)
+
+
+def get_store_file(source_file):
+    folder, file_name = os.path.split(source_file)
+    return os.path.join(get_store_folder(folder), os.path.splitext(file_name)[0] + '.npz')
+
+
+def is_fresh(source_file, store_file):
+    """
+    A converted file can only be used if it was written after the last change of its source
+    """
+    try:
+        return os.stat(store_file).st_mtime_ns >= os.stat(source_file).st_mtime_ns
+    except OSError:
+        return False
+
+
+def write_arrays(store_file, arrays, source_mtime_ns):
+    """
+    Writes the arrays to a .npz, through a temp file so readers never see a partial file. The converted file
+    gets the mtime the source had before it was read, so a source changed while converting stays stale
+    :param store_file: The destination .npz
+    :param arrays: dict of name: np.ndarray
+    :param source_mtime_ns: int, mtime of the source file before it was read
+    """
+    os.makedirs(os.path.dirname(store_file), exist_ok=True)
+    tmp_file = f"{store_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, **arrays)
+    os.utime(tmp_file, ns=(source_mtime_ns, source_mtime_ns))
+    os.replace(tmp_file, store_file)
+
+
+def get_ingest_lock(store_file):
+    with _ingest_locks_lock:
+        return _ingest_locks.setdefault(store_file, threading.Lock())
+
+
+def ingest_csv(source_file):
+    """
+    Converts a daily csv to the store, only the numeric (site) columns are kept
+    :param source_file: path of the csv
+    :return: str, path of the converted file
+    """
+    source_mtime_ns = os.stat(source_file).st_mtime_ns
+    data = pd.read_csv(source_file)
+    arrays = {col: data[col].to_numpy() for col in data.columns if pd.api.types.is_numeric_dtype(data[col])}
+    store_file = get_store_file(source_file)
+    write_arrays(store_file, arrays, source_mtime_ns)
+    return store_file
+
+
+def read_column(source_file, site):
+    """
+    Reads one site column of a daily csv from the store
+    :param source_file: path of the csv
+    :param site: The site column
+    :return: pd.Series or None when the store is disabled, stale or does not hold the site
+    """
+    if config.columnar_store_path is None:
+        return None
+    store_file = get_store_file(source_file)
+    if not is_fresh(source_file, store_file):
+        return None
+    try:
+        with np.load(store_file) as npz:
+            if site not in npz.files:
+                return None
+            return pd.Series(npz[site], name=site)
+    except (OSError, ValueError):
+        return None
+
+
+def read_all_columns(source_file):
+    """
+    Reads every site column of a daily csv from the store
+    :param source_file: path of the csv
+    :return: dict of site: np.ndarray or None when the store is disabled or stale
+    """
+    if config.columnar_store_path is None:
+        return None
+    store_file = get_store_file(source_file)
+    if not is_fresh(source_file, store_file):
+        return None
+    try:
+        with np.load(store_file) as npz:
+            return {site: npz[site] for site in npz.files}
+    except (OSError, ValueError):
+        return None
+
+
+def ingest_workbook(source_file):
+    """
+    Converts a daily log workbook to the store, keeping the last two columns of every sheet
+    :param source_file: path of the workbook
+    :return: str, path of the converted file
+    """
+    source_mtime_ns = os.stat(source_file).st_mtime_ns
+    sheets = pd.read_excel(source_file, engine='openpyxl', sheet_name=None)
+    arrays = {}
+    for sheet, data in sheets.items():
+        site_data = data.iloc[:, -2:].apply(pd.to_numeric, errors='coerce')
+        arrays[f"{sheet}.values"] = site_data.to_numpy(dtype=float)
+        arrays[f"{sheet}.columns"] = np.array([str(col)[-8:] for col in site_data.columns])
+    store_file = get_store_file(source_file)
+    write_arrays(store_file, arrays, source_mtime_ns)
+    return store_file
+
+
+def read_log_sheet(source_file, site):
+    """
+    Reads the last two columns of one site sheet of a log workbook from the store, converting the workbook
+    first if it is new or changed since it was last converted
+    :param source_file: path of the workbook
+    :param site: The sheet name
+    :return: pd.DataFrame, NO_SHEET when the workbook has no sheet for the site or None when the store is
+             disabled or unreadable
+    """
+    if config.columnar_store_path is None:
+        return None
+    store_file = get_store_file(source_file)
+    if not is_fresh(source_file, store_file):
+        # The threads reading other sites of a new workbook wait for a single conversion
+        with get_ingest_lock(store_file):
+            if not is_fresh(source_file, store_file):
+                ingest_workbook(source_file)
+    try:
+        with np.load(store_file) as npz:
+            if f"{site}.values" not in npz.files:
+                return NO_SHEET
+            return pd.DataFrame(npz[f"{site}.values"], columns=list(npz[f"{site}.columns"]))
+    except (OSError, ValueError):
+        return None
+
+
+def ingest_file(source_file):
+    if source_file.endswith('.xlsx'):
+        return ingest_workbook(source_file)
+    return ingest_csv(source_file)
+
+
+def ingest_folder(source_folder, source_type='csv', since=None, verbose=False):
+    """
+    Converts every stale daily file of a source folder, the files are the ones the readers resolve through
+    config.FILE_PATTERNS so names without a valid date (or copies losing to another file) are skipped
+    :param source_folder: The source folder
+    :param source_type: 'csv' or 'log', see funcs.get_dir_index
+    :param since: datetime.date, skip files of earlier dates
+    :return: int, number of files converted
+    """
+    # Imported here, funcs reads through this module
+    import funcs
+
+    converted = 0
+    index = funcs.get_dir_index(source_folder, source_type)
+    dates = [date for date in index.dates if since is None or date >= since]
+    for date in dates:
+        source_file = os.path.join(source_folder, index.files[date.strftime('%d-%m-%Y')])
+        if is_fresh(source_file, get_store_file(source_file)):
+            continue
+        try:
+            ingest_file(source_file)
+            converted += 1
+        except (OSError, ValueError, pd.errors.ParserError) as e:
+            if verbose:
+                print(f"Unable to ingest {source_file}, {e}")
+    return converted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert the daily source files to the columnar store")
+    parser.add_argument('--days', type=int, default=None, help="Only ingest the last N days")
+    args = parser.parse_args()
+
+    since_date = None
+    if args.days is not None:
+        since_date = datetime.date.today() - datetime.timedelta(days=args.days)
+
+    for folder, source_type in [(config.real_path, 'csv'), (config.intra_day_path, 'csv'),
+                                (config.day_ahead_ensemble_path, 'csv'), (config.satellite_forecast_path, 'csv'),
+                                (config.logs_path, 'log')]:
+        n_files = ingest_folder(folder, source_type=source_type, since=since_date, verbose=True)
+        print(f"{folder}: {n_files} files ingested")
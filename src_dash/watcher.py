@@ -0,0 +1,122 @@
+"""
+Watches the source files of the recent days and pushes a "data changed for date X" event to the browsers
+over server-sent events, so the graphs refresh when a file lands instead of on every interval tick.
+The folders are polled with stat (inotify does not see changes made on the NFS server).
+"""
+import os
+import json
+import time
+import logging
+import datetime
+import threading
+from collections import deque
+import config
+import funcs
+
+logger = logging.getLogger(__name__)
+
+# {date: version} of the watched dates and the last events as (event id, date, version)
+_versions = {}
+_events = deque(maxlen=100)
+_last_event_id = 0
+_events_condition = threading.Condition()
+_watcher_thread = None
+
+
+def get_watched_dates():
+    today = datetime.date.today()
+    return [(today + datetime.timedelta(days=day)).strftime('%d-%m-%Y') for day in config.WATCH_DAYS]
+
+
+def publish(date, version):
+    global _last_event_id
+    with _events_condition:
+        _last_event_id += 1
+        _events.append((_last_event_id, date, version))
+        _events_condition.notify_all()
+
+
+def poll_once():
+    """
+    Compares the versions of the watched dates with the previous poll, publishing an event per changed date
+    :return: list of the changed dates
+    """
+    changed = []
+    dates = get_watched_dates()
+    for date in dates:
+        version = funcs.get_date_version(paths=funcs.get_source_paths(), date=date)
+        previous = _versions.get(date)
+        _versions[date] = version
+        if previous is not None and previous != version:
+            changed.append(date)
+            publish(date, repr(version))
+    for date in [date for date in _versions if date not in dates]:
+        del _versions[date]
+    return changed
+
+
+def get_events_after(last_id, timeout):
+    """
+    Waits up to timeout seconds for events newer than last_id
+    :return: list of (event id, date, version)
+    """
+    with _events_condition:
+        _events_condition.wait_for(lambda: _last_event_id > last_id, timeout=timeout)
+        return [event for event in _events if event[0] > last_id]
+
+
+def format_event_id(event_id):
+    """
+    Id of an event as sent to the browsers, prefixed with the pid since every worker numbers its own events
+    """
+    return f"{os.getpid()}-{event_id}"
+
+
+def parse_event_id(last_event_id):
+    """
+    :param last_event_id: str, Last-Event-ID header of a reconnecting browser or None
+    :return: int id of an event of this process, None when the id comes from another worker or is invalid
+    """
+    pid, _, event_id = (last_event_id or '').partition('-')
+    if pid != str(os.getpid()) or not event_id.isdigit():
+        return None
+    return int(event_id)
+
+
+def stream_events(last_id=None):
+    """
+    Server-sent events stream of the data changes, a comment is sent every config.SSE_KEEPALIVE_SECS so
+    proxies keep the connection open
+    :param last_id: id of the last event of this process the browser received when it reconnects, see
+                    parse_event_id
+    """
+    if last_id is None or last_id > _last_event_id:
+        last_id = _last_event_id
+    yield f"retry: {config.SSE_RETRY_MS}\n\n"
+    while True:
+        events = get_events_after(last_id, timeout=config.SSE_KEEPALIVE_SECS)
+        if not events:
+            yield ": keep-alive\n\n"
+            continue
+        for event_id, date, version in events:
+            last_id = event_id
+            yield f"id: {format_event_id(event_id)}\ndata: {json.dumps(dict(date=date, version=version))}\n\n"
+
+
+def _run_watcher():
+    while True:
+        try:
+            changed = poll_once()
+            if changed:
+                logger.debug(f"Data changed for {changed}")
+        except Exception:
+            logger.exception("Watching the source folders failed")
+        time.sleep(config.WATCH_INTERVAL_SECS)
+
+
+def start_watcher():
+    global _watcher_thread
+    if _watcher_thread is None:
+        _watcher_thread = threading.Thread(target=_run_watcher, name='source-watcher', daemon=True)
+        _watcher_thread.start()
+    return _watcher_thread
@@ -0,0 +1,5 @@
+"""
+WSGI entry point of the dashboard for production serving, run from src_dash:
+    gunicorn -c gunicorn.conf.py wsgi:server
+"""
+from main import server  # noqa: F401